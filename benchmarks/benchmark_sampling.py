@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+for tool_dir in ("forwarding-history", "channel-reputation", "utilization"):
+    sys.path.insert(0, str(REPO_DIR / tool_dir))
+
+import ln_data  # noqa: E402
+import reputation  # noqa: E402
+import calculate_utilization  # noqa: E402
+import forwarding_index  # noqa: E402
+import sampling  # noqa: E402
+
+FORWARD_COUNT = 500000
+CHANNEL_COUNT = 200
+DAYS = 180
+FRACTIONS = [0.01, 0.05, 0.1, 0.25]
+HTLC_RESOLUTION_TIME = 60  # seconds
+
+
+def generate_data(data_dir: Path, forward_count: int, channel_count: int, days: int, seed: int = 1):
+    """Write a synthetic forwarding history and channel capacities with skewed channel activity."""
+    rng = random.Random(seed)
+    channels = [str(800000000000000 + i * 7919) for i in range(channel_count)]
+    # A few busy channels carry most of the traffic
+    weights = [1.0 / (i + 1) for i in range(channel_count)]
+
+    forwards_file = data_dir / "forwarding_events.csv"
+    start_ns = 1735689600 * 10**9
+    step_ns = days * 24 * 60 * 60 * 10**9 // forward_count
+    with open(forwards_file, "w") as f:
+        f.write("timestamp_ns,chan_id_in,chan_id_out,amt_in_msat,amt_out_msat,fee_msat\n")
+        timestamp_ns = start_ns
+        for _ in range(forward_count):
+            timestamp_ns += int(rng.expovariate(1.0) * step_ns)
+            chan_in, chan_out = rng.choices(channels, weights, k=2)
+            amt = rng.randint(1000, 2000000000)
+            fee = rng.randint(0, 5000)
+            f.write(f'"{timestamp_ns}","{chan_in}","{chan_out}","{amt + fee}","{amt}","{fee}"\n')
+
+    channels_file = data_dir / "channel_capacities.csv"
+    with open(channels_file, "w") as f:
+        f.write("short_channel_id,capacity,max_accepted_htlcs\n")
+        for chan in channels:
+            f.write(f'"{chan}","{rng.randint(10**6, 10**8)}",483\n')
+
+    return forwards_file, channels_file, (timestamp_ns + 1) / 1e9
+
+
+def exact_utilization(forwards_file, channel_info):
+    forwards = ln_data.load_forwards(forwards_file)
+    distribution = ln_data.simulate_utilization(forwards, channel_info, HTLC_RESOLUTION_TIME)
+    total_time = distribution['total_time']
+    return {bucket: time_val / total_time for bucket, time_val in distribution['slot_bucket_times'].items()}
+
+
+def sampled_utilization(forwards_file, channel_info, fraction, sample_by):
+    estimate = calculate_utilization.estimate_sample(forwards_file, channel_info, fraction, sample_by, HTLC_RESOLUTION_TIME)
+    return {bucket: values['percent'] for bucket, values in estimate['slot_buckets'].items()}, estimate['sampled_units']
+
+
+def exact_reputation(forwards_file, now_ts):
+    channels = ln_data.compute_reputation(ln_data.load_forwards(forwards_file), now_ts=now_ts)
+    return sum(scores["reputation"] for scores in channels.values())
+
+
+def sampled_reputation(forwards_file, now_ts, fraction, sample_by):
+    estimate = reputation.estimate_sample(forwards_file, fraction, sample_by, now_ts=now_ts)
+    return estimate['totals']["reputation"], estimate['sampled_units']
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sampled estimates against the exact engines")
+    parser.add_argument("--forwards", type=int, default=FORWARD_COUNT, help=f"Number of synthetic forwards (default: {FORWARD_COUNT})")
+    parser.add_argument("--channels", type=int, default=CHANNEL_COUNT, help=f"Number of synthetic channels (default: {CHANNEL_COUNT})")
+    parser.add_argument("--days", type=int, default=DAYS, help=f"Days of synthetic history (default: {DAYS})")
+    parser.add_argument("--fractions", type=float, nargs="+", default=FRACTIONS,
+                        help=f"Sample fractions to benchmark (default: {' '.join(str(f) for f in FRACTIONS)})")
+    args = parser.parse_args()
+
+    if any(not 0 < fraction <= 1 for fraction in args.fractions):
+        parser.error("--fractions must each be greater than 0 and at most 1")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"Generating {args.forwards} forwards over {args.days} days for {args.channels} channels...")
+        forwards_file, channels_file, now_ts = generate_data(Path(tmp_dir), args.forwards, args.channels, args.days)
+        channel_info = ln_data.load_channel_info(channels_file)
+
+        _, index_time = timed(forwarding_index.load_index, forwards_file)
+        print(f"Built forwarding index in {index_time:.2f}s (one-off, reused by block sampling)")
+        print("")
+
+        exact_util, exact_util_time = timed(exact_utilization, forwards_file, channel_info)
+        exact_rep, exact_rep_time = timed(exact_reputation, forwards_file, now_ts)
+
+        print("Utilization (slot distribution, 60s resolution time):")
+        print(f"{'Mode':<10} {'Fraction':>8} {'Units':>6} {'Time (s)':>9} {'Speedup':>8} {'Max error':>10} {'Max 95% CI':>11} {'Covered':>8}")
+        print(f"{'exact':<10} {1.0:>8.2f} {'-':>6} {exact_util_time:>9.2f} {1.0:>7.1f}x {'-':>10} {'-':>11} {'-':>8}")
+        for sample_by in sampling.SAMPLE_BY:
+            for fraction in args.fractions:
+                (estimate, units), elapsed = timed(sampled_utilization, forwards_file, channel_info, fraction, sample_by)
+                errors = {bucket: abs(estimate[bucket][0] - exact_util[bucket]) for bucket in exact_util}
+                half_widths = {bucket: sampling.Z_95 * estimate[bucket][1] for bucket in exact_util}
+                covered = sum(1 for bucket in exact_util if errors[bucket] <= half_widths[bucket])
+                print(f"{sample_by:<10} {fraction:>8.2f} {units:>6} {elapsed:>9.2f} {exact_util_time / elapsed:>7.1f}x "
+                      f"{max(errors.values()) * 100:>9.2f}% {max(half_widths.values()) * 100:>10.2f}% "
+                      f"{covered:>4}/{len(exact_util):<3}")
+        print("")
+
+        print("Reputation (total across channels):")
+        print(f"{'Mode':<10} {'Fraction':>8} {'Units':>6} {'Time (s)':>9} {'Speedup':>8} {'Rel error':>10} {'95% CI':>11} {'Covered':>8}")
+        print(f"{'exact':<10} {1.0:>8.2f} {'-':>6} {exact_rep_time:>9.2f} {1.0:>7.1f}x {'-':>10} {'-':>11} {'-':>8}")
+        for sample_by in sampling.SAMPLE_BY:
+            for fraction in args.fractions:
+                ((total, se), units), elapsed = timed(sampled_reputation, forwards_file, now_ts, fraction, sample_by)
+                error = abs(total - exact_rep) / exact_rep if exact_rep else 0.0
+                half_width = sampling.Z_95 * se / exact_rep if exact_rep else 0.0
+                print(f"{sample_by:<10} {fraction:>8.2f} {units:>6} {elapsed:>9.2f} {exact_rep_time / elapsed:>7.1f}x "
+                      f"{error * 100:>9.2f}% {half_width * 100:>10.2f}% {'yes' if error <= half_width else 'no':>8}")
+
+        # Remove the index alongside the temporary data
+        os.remove(forwarding_index.index_path_for(forwards_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import urllib.request
+
+from reputation import compute_reputation, REVENUE_WINDOW_SECS, REPUTATION_MULTIPLIER
+import reputation_daemon
+from reputation_daemon import ReputationState, run, serve_metrics, tail_forwards_csv
+
+FORWARD_COUNT = 5000
+CHANNEL_COUNT = 20
+SCRAPE_EVERY = 100  # forwards
+TOLERANCE = 1e-6  # relative
+TAIL_TIMEOUT = 10.0  # seconds
+POLL_INTERVAL = 0.01  # seconds
+EXPORT_PAGES = 5
+
+
+def stub_forwards(forward_count: int, channel_count: int, start_ts: float, end_ts: float, seed: int = 1):
+    """Generate forwards between start_ts and end_ts, in timestamp order."""
+    rng = random.Random(seed)
+    channels = [str(800000000000000 + i * 7919) for i in range(channel_count)]
+    timestamps = sorted(rng.uniform(start_ts, end_ts) for _ in range(forward_count))
+    return [
+        {
+            'timestamp': timestamp,
+            'chan_id_in': rng.choice(channels),
+            'chan_id_out': rng.choice(channels),
+            'fee_msat': rng.randint(0, 5000),
+        }
+        for timestamp in timestamps
+    ]
+
+
+def scraped_source(forwards, state: ReputationState, metrics_url: str, scrape_every: int):
+    """Yield forwards, scraping metrics every scrape_every forwards as a Prometheus server would."""
+    for i, fwd in enumerate(forwards):
+        if i % scrape_every == 0:
+            with urllib.request.urlopen(metrics_url) as response:
+                response.read()
+        yield fwd
+
+
+def check_scraped_scores(forwards, now_ts: float, scrape_every: int, port: int):
+    """Apply forwards to the daemon while scraping it, and compare its scores to the batch computation."""
+    lookback_secs = REVENUE_WINDOW_SECS * REPUTATION_MULTIPLIER
+    state = ReputationState(int(now_ts - lookback_secs), REVENUE_WINDOW_SECS, REPUTATION_MULTIPLIER)
+    server = serve_metrics(state, "127.0.0.1", port)
+    metrics_url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+    try:
+        run(state, scraped_source(forwards, state, metrics_url, scrape_every))
+    finally:
+        server.shutdown()
+
+    expected = compute_reputation(forwards, REVENUE_WINDOW_SECS, REPUTATION_MULTIPLIER, now_ts)
+    actual = state.scores(now_ts)
+
+    mismatches = []
+    if set(expected) != set(actual):
+        mismatches.append(f"channels differ: {sorted(set(expected) ^ set(actual))}")
+    for cid in sorted(set(expected) & set(actual)):
+        for score in ("reputation", "revenue"):
+            want, got = expected[cid][score], actual[cid][score]
+            if abs(want - got) > TOLERANCE * max(abs(want), 1.0):
+                mismatches.append(f"{cid} {score}: expected {want}, got {got}")
+    return mismatches
+
+
+def take(tail, count: int, timeout: float = TAIL_TIMEOUT):
+    """Take up to count forwards from a tail, giving up after timeout if it stops yielding."""
+    taken = []
+
+    def consume():
+        for fwd in tail:
+            taken.append(fwd)
+            if len(taken) == count:
+                return
+
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return list(taken)
+
+
+def write_rows(f, rows):
+    for fwd in rows:
+        f.write(f'"{int(fwd["timestamp"] * 1e9)}","{fwd["chan_id_in"]}","{fwd["chan_id_out"]}",'
+                f'"{1000 + fwd["fee_msat"]}","1000","{fwd["fee_msat"]}"\n')
+
+
+def export_in_pages(csv_file, rows, pages: int):
+    """Truncate and rewrite a CSV in place a page at a time, as lnd-forwarding-history.sh does."""
+    page_size = -(-len(rows) // pages)
+    with open(csv_file, 'r+') as f:
+        f.truncate(0)
+        f.write("timestamp_ns,chan_id_in,chan_id_out,amt_in_msat,amt_out_msat,fee_msat\n")
+        for start in range(0, len(rows), page_size):
+            write_rows(f, rows[start:start + page_size])
+            f.flush()
+            # Let the tail poll between pages
+            time.sleep(POLL_INTERVAL * 5)
+
+
+def check_csv_rewrite(forwards, one_shot: bool):
+    """Tail a CSV that is re-exported, and check every forward is seen once.
+
+    The re-export starts from a later time, so rows move to different
+    offsets. It is either written at once, growing past the position
+    already read before the next poll, or a page at a time over several
+    polls.
+    """
+    half = len(forwards) // 2
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_file = os.path.join(tmp_dir, "forwarding_events.csv")
+        with open(csv_file, 'w') as f:
+            f.write("timestamp_ns,chan_id_in,chan_id_out,amt_in_msat,amt_out_msat,fee_msat\n")
+            write_rows(f, forwards[:half])
+
+        tail = tail_forwards_csv(csv_file, poll_interval=POLL_INTERVAL)
+        seen = take(tail, half)
+
+        writer = threading.Thread(target=export_in_pages,
+                                  args=(csv_file, forwards[half // 10:], 1 if one_shot else EXPORT_PAGES))
+        writer.start()
+        seen += take(tail, len(forwards) - half)
+        writer.join()
+
+    expected = [(int(fwd["timestamp"] * 1e9), fwd["fee_msat"]) for fwd in forwards]
+    actual = [(round(fwd["timestamp"] * 1e9), fwd["fee_msat"]) for fwd in seen]
+    mismatches = []
+    if len(actual) != len(expected):
+        mismatches.append(f"tailed {len(actual)} of {len(expected)} forwards")
+    for i, (want, got) in enumerate(zip(expected, actual)):
+        if want[1] != got[1] or abs(want[0] - got[0]) > 1000:
+            mismatches.append(f"tailed forward {i}: expected {want}, got {got}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the reputation daemon against the batch computation, using a stub event source.")
+    parser.add_argument("--forwards", type=int, default=FORWARD_COUNT, help=f"Number of stub forwards (default: {FORWARD_COUNT})")
+    parser.add_argument("--channels", type=int, default=CHANNEL_COUNT, help=f"Number of stub channels (default: {CHANNEL_COUNT})")
+    parser.add_argument("--scrape-every", type=int, default=SCRAPE_EVERY, help=f"Scrape metrics every N forwards (default: {SCRAPE_EVERY})")
+    parser.add_argument("--port", type=int, default=0, help="Port to serve metrics on (default: any free port)")
+    args = parser.parse_args()
+
+    # Forwards are in the past, so scrapes (at the current time) are
+    # interleaved with forwards older than them.
+    now_ts = time.time()
+    lookback_secs = REVENUE_WINDOW_SECS * REPUTATION_MULTIPLIER
+    forwards = stub_forwards(args.forwards, args.channels, now_ts - lookback_secs, now_ts - 60)
+
+    mismatches = check_scraped_scores(forwards, now_ts, args.scrape_every, args.port)
+
+    # Use small reads, so that rows span several reads
+    reputation_daemon.READ_CHUNK_BYTES = 4096
+    mismatches += check_csv_rewrite(forwards, one_shot=True)
+    mismatches += check_csv_rewrite(forwards, one_shot=False)
+
+    if mismatches:
+        print(f"FAILED: {len(mismatches)} mismatches")
+        for mismatch in mismatches:
+            print(f"  {mismatch}")
+        sys.exit(1)
+
+    print(f"OK: {len(forwards)} stub forwards match the batch computation, and were tailed once each across rewrites")
+
+
+if __name__ == "__main__":
+    main()
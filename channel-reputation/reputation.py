@@ -1,9 +1,28 @@
+import os
+import sys
 import time
 import csv
-import datetime as dt
 from collections import defaultdict
 import argparse
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "forwarding-history"))
+
+from forwards import load_forwards  # noqa: E402
+from sampling import (  # noqa: E402
+    SAMPLE_BY,
+    SAMPLE_BY_CHANNEL,
+    SAMPLE_BY_BLOCK,
+    BLOCK_SECS,
+    Z_95,
+    MIN_SAMPLED_UNITS,
+    Sampler,
+    load_channel_sample,
+    sampled_blocks,
+    load_block_sample,
+    channel_count,
+    ht_total,
+)
+
 REVENUE_WINDOW_SECS = 60 * 60 * 24 * 14  # 2 weeks
 REPUTATION_MULTIPLIER = 12
 INPUT_CSV_FILE = "forwarding_data.csv"
@@ -23,10 +42,16 @@ class DecayingAverage:
             if abs(elapsed) > 1.0:
                 raise ValueError("Update attempted in the past")
             return self.value
-        self.value *= (self.decay_rate ** elapsed)
+        self.value = self.peek(now_ts)
         self.last_updated = now_ts
         return self.value
 
+    def peek(self, now_ts: float):
+        """Value at now_ts, without updating the average (so older values can still be added)."""
+        if self.last_updated is None or now_ts <= self.last_updated:
+            return self.value
+        return self.value * (self.decay_rate ** (now_ts - self.last_updated))
+
     def add_value(self, val: float, now_ts: float):
         self.value_at(now_ts)
         self.value += val
@@ -42,45 +67,214 @@ class RevenueAverage:
         self.window_duration = revenue_window_secs
         self.aggregated = DecayingAverage(revenue_window_secs * multiplier)
 
+    @property
+    def last_updated(self):
+        return self.aggregated.last_updated
+
     def add_value(self, val: float, now_ts: float):
         return self.aggregated.add_value(val, now_ts)
 
     def windows_tracked(self, now_ts: float) -> float:
         return (now_ts - self.start_ts) / self.window_duration
 
-    def value_at(self, now_ts: float) -> float:
+    def divisor(self, now_ts: float) -> float:
         tracked = self.windows_tracked(now_ts)
-        divisor = min(max(tracked, 1.0), float(self.window_count))
+        return min(max(tracked, 1.0), float(self.window_count))
+
+    def value_at(self, now_ts: float) -> float:
         decayed = self.aggregated.value_at(now_ts)
-        return decayed / divisor
+        return decayed / self.divisor(now_ts)
+
+    def peek(self, now_ts: float) -> float:
+        """Value at now_ts, without updating the average."""
+        return self.aggregated.peek(now_ts) / self.divisor(now_ts)
 
 
-def read_forwards_from_csv(input_csv_file: str):
+def read_forwards_from_csv(input_csv_file: str, start_ts: float = None, end_ts: float = None):
     forwards = []
     try:
-        with open(input_csv_file, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                row = {key.strip(): value.strip().strip('"') for key, value in row.items()}
-                forwards.append({
-                    'timestamp': int(row['timestamp_ns']) / 1e9,  # Convert ns to seconds
-                    'chan_id_in': row['chan_id_in'],
-                    'chan_id_out': row['chan_id_out'],
-                    'fee_msat': int(row['fee_msat']),
-                })
+        forwards = load_forwards(input_csv_file, start_ts, end_ts)
     except Exception as e:
         print(f"Error reading forwards CSV: {e}")
     return forwards
 
 
+def compute_reputation(forwards, revenue_window_secs: float = REVENUE_WINDOW_SECS,
+                       reputation_multiplier: int = REPUTATION_MULTIPLIER, now_ts: float = None):
+    """Compute per-channel reputation and revenue from forwards, as of now_ts.
+
+    Forwards may be any iterable, and are processed in timestamp order.
+    Returns a mapping of channel id to its (unrounded) reputation and
+    revenue, sorted by channel id.
+    """
+    if now_ts is None:
+        now_ts = time.time()
+
+    # Calculate lookback period from revenue window and multiplier
+    lookback_secs = revenue_window_secs * reputation_multiplier
+    start_ts = int(now_ts - lookback_secs)
+
+    channels = defaultdict(lambda: {
+        "reputation": DecayingAverage(revenue_window_secs * reputation_multiplier),
+        "revenue": RevenueAverage(start_ts, revenue_window_secs, reputation_multiplier),
+    })
+
+    for fwd in sorted(forwards, key=lambda x: x.get('timestamp', 0)):
+        fee_msat = fwd.get('fee_msat', 0)
+        timestamp = fwd.get('timestamp', 0)
+
+        # Outgoing link → Reputation
+        if 'chan_id_out' in fwd and fwd['chan_id_out']:
+            chan_out = str(fwd['chan_id_out'])
+            channels[chan_out]["reputation"].add_value(fee_msat, timestamp)
+
+        # Incoming link → Revenue
+        if 'chan_id_in' in fwd and fwd['chan_id_in']:
+            chan_in = str(fwd['chan_id_in'])
+            channels[chan_in]["revenue"].add_value(fee_msat, timestamp)
+
+    return {
+        cid: {
+            "reputation": channels[cid]["reputation"].value_at(now_ts),
+            "revenue": channels[cid]["revenue"].value_at(now_ts),
+        }
+        for cid in sorted(channels.keys())
+    }
+
+
+def estimate_channel_sample(channels, sampler: Sampler):
+    """Estimate full-dataset scores from compute_reputation results for a sample of channels.
+
+    Scores for sampled channels are exact, totals across all channels are
+    scaled up by the sampling fraction.
+    """
+    sampled = {cid: scores for cid, scores in channels.items() if sampler.includes(cid)}
+    fraction = sampler.fraction
+
+    return {
+        'sampled_units': len(sampled),
+        'channels': {
+            cid: {"reputation": (scores["reputation"], 0.0), "revenue": (scores["revenue"], 0.0)}
+            for cid, scores in sampled.items()
+        },
+        'totals': {
+            "reputation": ht_total([scores["reputation"] for scores in sampled.values()], fraction),
+            "revenue": ht_total([scores["revenue"] for scores in sampled.values()], fraction),
+            "channel_count": ht_total([1] * len(sampled), fraction),
+        },
+    }
+
+
+def estimate_block_sample(block_channels, fraction: float, channel_count: int):
+    """Estimate full-dataset scores from compute_reputation results for each sampled time block.
+
+    Scores are a decayed sum of fees, so each block's contribution can be
+    scaled up by the sampling fraction, with standard errors across blocks.
+    Channels without forwards in any sampled block are estimated at zero,
+    and channel_count is the (exact) number of channels in the full data.
+    """
+    channel_ids = sorted(set(cid for channels in block_channels for cid in channels))
+    zero = {"reputation": 0.0, "revenue": 0.0}
+
+    estimate = {'sampled_units': len(block_channels), 'channels': {}, 'totals': {}}
+    for cid in channel_ids:
+        estimate['channels'][cid] = {
+            key: ht_total([channels.get(cid, zero)[key] for channels in block_channels], fraction)
+            for key in ("reputation", "revenue")
+        }
+
+    for key in ("reputation", "revenue"):
+        estimate['totals'][key] = ht_total(
+            [sum(scores[key] for scores in channels.values()) for channels in block_channels], fraction)
+
+    estimate['totals']["channel_count"] = (channel_count, 0.0)
+
+    return estimate
+
+
+def estimate_sample(input_csv_file: str, fraction: float, sample_by: str = SAMPLE_BY_CHANNEL,
+                    block_secs: float = BLOCK_SECS, seed: int = 0, start_ts: float = None, end_ts: float = None,
+                    revenue_window_secs: float = REVENUE_WINDOW_SECS, reputation_multiplier: int = REPUTATION_MULTIPLIER,
+                    now_ts: float = None):
+    """Estimate scores from a deterministic sample of the forwards in a CSV, as of now_ts."""
+    if now_ts is None:
+        now_ts = time.time()
+    sampler = Sampler(fraction, seed)
+
+    if sample_by == SAMPLE_BY_CHANNEL:
+        forwards = load_channel_sample(input_csv_file, sampler, ['chan_id_in', 'chan_id_out'], start_ts, end_ts)
+        channels = compute_reputation(forwards, revenue_window_secs, reputation_multiplier, now_ts)
+        estimate = estimate_channel_sample(channels, sampler)
+        estimate['forward_count'] = len(forwards)
+    else:
+        blocks = sampled_blocks(input_csv_file, sampler, block_secs, start_ts, end_ts)
+        block_forwards = load_block_sample(input_csv_file, blocks)
+        block_channels = [
+            compute_reputation(forwards, revenue_window_secs, reputation_multiplier, now_ts)
+            for forwards in block_forwards
+        ]
+        # Channels without forwards in any sampled block still count towards the total
+        total_channels = channel_count(input_csv_file, ['chan_id_in', 'chan_id_out'],
+                                       start_ts, end_ts, set().union(*block_channels))
+        estimate = estimate_block_sample(block_channels, fraction, total_channels)
+        estimate['forward_count'] = sum(len(forwards) for forwards in block_forwards)
+
+    return estimate
+
+
+def run_sampled(args, now_ts: float, output_file: str):
+    """Estimate scores from a deterministic sample of the forwards, and write them to a CSV."""
+    unit = "channels" if args.sample_by == SAMPLE_BY_CHANNEL else "time blocks"
+    print(f"Reading forwards for {args.sample * 100:.1f}% of {unit} from {args.input_csv_file}...")
+    estimate = estimate_sample(args.input_csv_file, args.sample, args.sample_by, args.sample_block_secs,
+                               args.sample_seed, args.start, args.end, args.revenue_window_secs,
+                               args.reputation_multiplier, now_ts)
+    print(f"Fetched {estimate['forward_count']} forwards for {estimate['sampled_units']} sampled {unit}.")
+
+    if estimate['sampled_units'] == 0:
+        hint = "--sample, or decrease --sample-block-secs" if args.sample_by == SAMPLE_BY_BLOCK else "--sample"
+        print(f"Error: No {unit} were sampled, increase {hint}")
+        sys.exit(1)
+
+    with open(output_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["channel_id", "reputation", "reputation_ci", "revenue", "revenue_ci"])
+        # Write in sorted order, replacing channel IDs with their position (for anonymization)
+        for mapped_id, scores in enumerate(estimate['channels'].values(), start=1):
+            rep, rep_se = scores["reputation"]
+            rev, rev_se = scores["revenue"]
+            writer.writerow([mapped_id, int(round(rep)), int(round(Z_95 * rep_se)),
+                             int(round(rev)), int(round(Z_95 * rev_se))])
+
+    totals = estimate['totals']
+    print("Estimated totals across all channels (95% confidence interval):")
+    for key in ("channel_count", "reputation", "revenue"):
+        value, se = totals[key]
+        print(f"  - {key}: {value:.0f} (± {Z_95 * se:.0f})")
+    if estimate['sampled_units'] < MIN_SAMPLED_UNITS:
+        print(f"Warning: only {estimate['sampled_units']} {unit} sampled, confidence intervals are unreliable")
+    print(f"Wrote {len(estimate['channels'])} channels to {output_file}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Calculate channel reputation and revenue from LND forwards.")
     parser.add_argument("--csv-file", default=None, help="Output CSV file name (default: auto-generated based on window parameters)")
     parser.add_argument("--input-csv-file", default=INPUT_CSV_FILE, help="Input CSV file with forwarding events (default: forwarding_data.csv)")
     parser.add_argument("--revenue-window-secs", type=int, default=REVENUE_WINDOW_SECS, help=f"Revenue window in seconds (default: {REVENUE_WINDOW_SECS}, which is 2 weeks)")
     parser.add_argument("--reputation-multiplier", type=int, default=REPUTATION_MULTIPLIER, help=f"Reputation multiplier (default: {REPUTATION_MULTIPLIER})")
+    parser.add_argument("--start", type=int, default=None, help="Only include forwards at or after this unix timestamp in seconds (default: all)")
+    parser.add_argument("--end", type=int, default=None, help="Only include forwards before this unix timestamp in seconds, and score channels as of this time (default: now)")
+    parser.add_argument("--sample", type=float, default=None, help="Estimate scores from this fraction of the data, eg 0.1 (default: exact)")
+    parser.add_argument("--sample-by", choices=SAMPLE_BY, default=SAMPLE_BY_CHANNEL, help=f"Sample channels or time blocks (default: {SAMPLE_BY_CHANNEL})")
+    parser.add_argument("--sample-block-secs", type=int, default=BLOCK_SECS, help=f"Time block size in seconds when sampling by block (default: {BLOCK_SECS}, which is 1 day)")
+    parser.add_argument("--sample-seed", type=int, default=0, help="Seed used to select sampled channels or blocks (default: 0)")
     args = parser.parse_args()
 
+    if args.sample is not None and not 0 < args.sample <= 1:
+        parser.error(f"--sample must be greater than 0 and at most 1, got {args.sample}")
+    if args.sample_block_secs <= 0:
+        parser.error(f"--sample-block-secs must be positive, got {args.sample_block_secs}")
+
     revenue_window_secs = args.revenue_window_secs
     reputation_multiplier = args.reputation_multiplier
 
@@ -90,53 +284,31 @@ def main():
 
     # Generate output filename if not specified
     if args.csv_file is None:
-        output_file = f"channel_scores_{revenue_window_days:.0f}days_{reputation_window_days:.0f}days.csv"
+        sample_label = "_sample" if args.sample is not None else ""
+        output_file = f"channel_scores_{revenue_window_days:.0f}days_{reputation_window_days:.0f}days{sample_label}.csv"
     else:
         output_file = args.csv_file
 
-    now_dt = dt.datetime.now(dt.UTC)
-    # Calculate lookback period from revenue window and multiplier
-    lookback_secs = revenue_window_secs * reputation_multiplier
-    start_dt = now_dt - dt.timedelta(seconds=lookback_secs)
-    start_ts = int(start_dt.timestamp())
+    # Score channels as of the end of the window, if one is given
+    now_ts = time.time() if args.end is None else args.end
+
+    if args.sample is not None:
+        run_sampled(args, now_ts, output_file)
+        return
 
     print(f"Reading forwards from {args.input_csv_file}...")
-    forwards = read_forwards_from_csv(args.input_csv_file)
+    forwards = read_forwards_from_csv(args.input_csv_file, args.start, args.end)
     print(f"Fetched {len(forwards)} forwards.")
 
-    channels = defaultdict(lambda: {
-        "reputation": DecayingAverage(revenue_window_secs * reputation_multiplier),
-        "revenue": RevenueAverage(start_ts, revenue_window_secs, reputation_multiplier),
-    })
-
-    for fwd in forwards:
-        fee_msat = fwd.get('fee_msat', 0)
-        timestamp = fwd.get('timestamp', 0)
-
-        # Outgoing link → Reputation
-        if 'chan_id_out' in fwd and fwd['chan_id_out']:
-            chan_out = str(fwd['chan_id_out'])
-            channels[chan_out]["reputation"].add_value(fee_msat, timestamp)
-
-        # Incoming link → Revenue
-        if 'chan_id_in' in fwd and fwd['chan_id_in']:
-            chan_in = str(fwd['chan_id_in'])
-            channels[chan_in]["revenue"].add_value(fee_msat, timestamp)
-
-    # Create sorted channel ID mapping (for anonymization)
-    sorted_channel_ids = sorted(channels.keys())
-    channel_id_mapping = {cid: idx + 1 for idx, cid in enumerate(sorted_channel_ids)}
+    channels = compute_reputation(forwards, revenue_window_secs, reputation_multiplier, now_ts)
 
     with open(output_file, "w", newline="") as f:
         writer = csv.writer(f)
         writer.writerow(["channel_id", "reputation", "revenue"])
-        now_ts = time.time()
-        # Write in sorted order by mapped ID
-        for cid in sorted_channel_ids:
-            data = channels[cid]
-            mapped_id = channel_id_mapping[cid]
-            rep = int(round(data["reputation"].value_at(now_ts)))
-            rev = int(round(data["revenue"].value_at(now_ts)))
+        # Write in sorted order, replacing channel IDs with their position (for anonymization)
+        for mapped_id, scores in enumerate(channels.values(), start=1):
+            rep = int(round(scores["reputation"]))
+            rev = int(round(scores["revenue"]))
             writer.writerow([mapped_id, rep, rev])
 
     print(f"Wrote {len(channels)} channels to {output_file}")
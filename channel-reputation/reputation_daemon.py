@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+
+import os
+import ssl
+import csv
+import sys
+import json
+import time
+import codecs
+import argparse
+import threading
+import urllib.request
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "forwarding-history"))
+
+from reputation import (  # noqa: E402
+    DecayingAverage,
+    RevenueAverage,
+    REVENUE_WINDOW_SECS,
+    REPUTATION_MULTIPLIER,
+    INPUT_CSV_FILE,
+)
+from forwarding_index import parse_row  # noqa: E402
+from forwards import parse_forward  # noqa: E402
+
+LISTEN_ADDRESS = "127.0.0.1"
+LISTEN_PORT = 9877
+REST_SERVER = "localhost:8080"
+POLL_INTERVAL = 1.0  # seconds
+ANCHOR_BYTES = 256  # bytes compared to detect a rewritten CSV
+READ_CHUNK_BYTES = 8 * 1024 * 1024  # bytes of CSV read at a time
+MIN_RECONNECT_DELAY = 1.0  # seconds
+MAX_RECONNECT_DELAY = 60.0  # seconds
+
+
+class ReputationState:
+    """Per-channel reputation and revenue, updated in O(1) per forward.
+
+    Updates and reads may come from different threads, so all access to
+    the underlying averages is guarded by a lock. Reads never modify the
+    averages, so reading scores at the current time doesn't prevent older
+    forwards (eg, while bootstrapping) from being added afterwards.
+    """
+    def __init__(self, start_ts: float, revenue_window_secs: float, multiplier: int):
+        self.lock = threading.Lock()
+        self.forwards_processed = 0
+        self.last_timestamp = 0.0
+        self.channels = defaultdict(lambda: {
+            "reputation": DecayingAverage(revenue_window_secs * multiplier),
+            "revenue": RevenueAverage(start_ts, revenue_window_secs, multiplier),
+        })
+
+    def add_forward(self, fwd):
+        """Apply a forward to its channels' scores.
+
+        Raises ValueError, without changing any scores, if the forward is
+        older than the last update to one of its channels.
+        """
+        fee_msat = fwd.get('fee_msat', 0)
+        timestamp = fwd.get('timestamp', 0)
+
+        with self.lock:
+            updates = []
+            # Outgoing link → Reputation
+            if fwd.get('chan_id_out'):
+                updates.append(self.channels[str(fwd['chan_id_out'])]["reputation"])
+            # Incoming link → Revenue
+            if fwd.get('chan_id_in'):
+                updates.append(self.channels[str(fwd['chan_id_in'])]["revenue"])
+
+            for average in updates:
+                last_updated = average.last_updated
+                if last_updated is not None and timestamp < last_updated - 1.0:
+                    raise ValueError(f"Forward at {timestamp} is older than the last update at {last_updated}")
+
+            for average in updates:
+                average.add_value(fee_msat, timestamp)
+
+            self.forwards_processed += 1
+            self.last_timestamp = max(self.last_timestamp, timestamp)
+
+    def scores(self, now_ts: float = None):
+        """Current reputation and revenue per channel id."""
+        with self.lock:
+            # Never read values before the latest update, in case of clock skew
+            now_ts = max(now_ts if now_ts is not None else time.time(), self.last_timestamp)
+            return {
+                cid: {
+                    "reputation": data["reputation"].peek(now_ts),
+                    "revenue": data["revenue"].peek(now_ts),
+                }
+                for cid, data in sorted(self.channels.items())
+            }
+
+    def prometheus_text(self, now_ts: float = None):
+        """Render current scores in the Prometheus text exposition format."""
+        scores = self.scores(now_ts)
+
+        lines = []
+        lines.append("# HELP ln_channel_reputation_msat Decaying average of fees earned by forwards out of the channel.")
+        lines.append("# TYPE ln_channel_reputation_msat gauge")
+        for cid, data in scores.items():
+            lines.append(f'ln_channel_reputation_msat{{channel_id="{cid}"}} {data["reputation"]:.3f}')
+
+        lines.append("# HELP ln_channel_revenue_msat Windowed average of fees earned by forwards into the channel.")
+        lines.append("# TYPE ln_channel_revenue_msat gauge")
+        for cid, data in scores.items():
+            lines.append(f'ln_channel_revenue_msat{{channel_id="{cid}"}} {data["revenue"]:.3f}')
+
+        lines.append("# HELP ln_reputation_forwards_processed_total Forwards applied to reputation state.")
+        lines.append("# TYPE ln_reputation_forwards_processed_total counter")
+        lines.append(f"ln_reputation_forwards_processed_total {self.forwards_processed}")
+
+        return "\n".join(lines) + "\n"
+
+
+def tail_forwards_csv(input_csv_file: str, poll_interval: float = POLL_INTERVAL, follow: bool = True):
+    """Yield forwards from a forwarding CSV, then follow rows appended to it.
+
+    If the file is rewritten (eg, it is re-exported), it is read again from
+    the start. A rewrite is detected by the file being replaced, shrinking,
+    or no longer containing the bytes last read before the current
+    position, since a re-export may grow past that position between polls.
+    Exports are sorted by timestamp, so forwards that are no newer than the
+    last one yielded (eg, rows of a re-export) are skipped, as are rows
+    that can't be parsed. The file is read in bounded chunks.
+    """
+    position = 0
+    inode = None
+    # The last bytes read, ending at position
+    anchor = b""
+    header = None
+    last_timestamp_ns = -1
+    pending = b""
+
+    while True:
+        if os.path.exists(input_csv_file):
+            with open(input_csv_file, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                rewritten = inode is not None and stat.st_ino != inode
+                if not rewritten and position > 0:
+                    if stat.st_size < position:
+                        rewritten = True
+                    else:
+                        f.seek(position - len(anchor))
+                        rewritten = f.read(len(anchor)) != anchor
+
+                if rewritten:
+                    position = 0
+                    anchor = b""
+                    header = None
+                    pending = b""
+
+                inode = stat.st_ino
+                f.seek(position)
+                while True:
+                    data = f.read(READ_CHUNK_BYTES)
+                    at_end = len(data) < READ_CHUNK_BYTES
+                    position += len(data)
+                    anchor = (anchor + data)[-ANCHOR_BYTES:]
+
+                    # Only consume complete lines, a partial row may still be
+                    # written unless we're not following the file.
+                    pending += data
+                    lines = pending.split(b"\n")
+                    pending = b"" if at_end and not follow else lines.pop()
+
+                    for values in csv.reader(line.decode('utf-8', errors='replace') for line in lines):
+                        if not values:
+                            continue
+                        if header is None:
+                            header = values
+                            continue
+
+                        try:
+                            row = parse_row(header, values)
+                            timestamp_ns = int(row['timestamp_ns'])
+                            fwd = parse_forward(row)
+                        except (KeyError, ValueError) as e:
+                            print(f"Warning: skipping unparseable forward {values}: {e}")
+                            continue
+
+                        if timestamp_ns <= last_timestamp_ns:
+                            continue
+                        last_timestamp_ns = timestamp_ns
+                        yield fwd
+
+                    if at_end:
+                        break
+
+        if not follow:
+            return
+        time.sleep(poll_interval)
+
+
+def forwards_from_htlc_events(events):
+    """Yield settled forwards from a stream of LND HTLC events (as decoded JSON).
+
+    Forward events carry the amounts, and are held until the matching
+    settle event arrives. Failed forwards are dropped.
+    """
+    # Forward events waiting to be settled, keyed by their HTLC identifiers
+    in_flight = {}
+
+    for event in events:
+        if event.get('event_type') != 'FORWARD':
+            continue
+
+        key = (
+            event.get('incoming_channel_id'),
+            event.get('incoming_htlc_id'),
+            event.get('outgoing_channel_id'),
+            event.get('outgoing_htlc_id'),
+        )
+
+        if 'forward_event' in event:
+            info = event['forward_event'].get('info', {})
+            in_flight[key] = int(info.get('incoming_amt_msat', 0)) - int(info.get('outgoing_amt_msat', 0))
+        elif 'settle_event' in event:
+            if key in in_flight:
+                yield {
+                    'timestamp': int(event['timestamp_ns']) / 1e9,
+                    'chan_id_in': event['incoming_channel_id'],
+                    'chan_id_out': event['outgoing_channel_id'],
+                    'fee_msat': in_flight.pop(key),
+                }
+        elif 'forward_fail_event' in event or 'link_fail_event' in event:
+            in_flight.pop(key, None)
+
+
+def lnd_htlc_events(rest_server: str, macaroon_path: str, tls_cert_path: str):
+    """Yield HTLC events from LND's REST SubscribeHtlcEvents stream."""
+    with open(macaroon_path, 'rb') as f:
+        macaroon = f.read().hex()
+
+    context = ssl.create_default_context(cafile=tls_cert_path)
+    request = urllib.request.Request(
+        f"https://{rest_server}/v2/router/htlcevents",
+        headers={"Grpc-Metadata-macaroon": macaroon},
+    )
+
+    # Events are streamed as one JSON object per line
+    with urllib.request.urlopen(request, context=context) as response:
+        for line in codecs.iterdecode(response, 'utf-8'):
+            if line.strip():
+                yield json.loads(line).get('result', {})
+
+
+def reconnecting(subscribe, min_delay: float = MIN_RECONNECT_DELAY, max_delay: float = MAX_RECONNECT_DELAY):
+    """Yield events from subscribe() forever, re-subscribing when the stream ends or fails.
+
+    Reconnects back off exponentially up to max_delay, and the backoff is
+    reset once a connection yields an event.
+    """
+    delay = min_delay
+    while True:
+        try:
+            for event in subscribe():
+                delay = min_delay
+                yield event
+            print("Warning: event stream closed")
+        except (OSError, ValueError) as e:
+            # URLError and JSONDecodeError are subclasses of these
+            print(f"Warning: event stream failed: {e}")
+
+        print(f"Reconnecting in {delay:g}s...")
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+def make_handler(state: ReputationState):
+    """Create a request handler that serves state at /metrics."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+
+            body = state.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+def serve_metrics(state: ReputationState, address: str = LISTEN_ADDRESS, port: int = LISTEN_PORT):
+    """Serve state over HTTP in a background thread, returning the server."""
+    server = ThreadingHTTPServer((address, port), make_handler(state))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def run(state: ReputationState, source):
+    """Apply every forward from an event source (any iterable of forwards) to state.
+
+    Forwards that can't be applied (eg, out of order) are skipped, so that
+    the daemon keeps serving.
+    """
+    for fwd in source:
+        try:
+            state.add_forward(fwd)
+        except ValueError as e:
+            print(f"Warning: skipping forward: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Continuously score channel reputation and revenue, serving Prometheus metrics.")
+    parser.add_argument("--source", choices=["csv", "lnd"], default="csv", help="Forward event source: tail a forwarding CSV, or subscribe to LND's HTLC events (default: csv)")
+    parser.add_argument("--input-csv-file", default=None, help=f"Forwarding CSV to tail, or to bootstrap history from when subscribing to LND (default: {INPUT_CSV_FILE} for csv source)")
+    parser.add_argument("--revenue-window-secs", type=int, default=REVENUE_WINDOW_SECS, help=f"Revenue window in seconds (default: {REVENUE_WINDOW_SECS}, which is 2 weeks)")
+    parser.add_argument("--reputation-multiplier", type=int, default=REPUTATION_MULTIPLIER, help=f"Reputation multiplier (default: {REPUTATION_MULTIPLIER})")
+    parser.add_argument("--listen-address", default=LISTEN_ADDRESS, help=f"Address to serve metrics on (default: {LISTEN_ADDRESS})")
+    parser.add_argument("--port", type=int, default=LISTEN_PORT, help=f"Port to serve metrics on (default: {LISTEN_PORT})")
+    parser.add_argument("--restserver", default=REST_SERVER, help=f"LND REST server, for lnd source (default: {REST_SERVER})")
+    parser.add_argument("--macaroonpath", default=None, help="LND read-only macaroon, for lnd source")
+    parser.add_argument("--tlscertpath", default=None, help="LND TLS certificate, for lnd source")
+    args = parser.parse_args()
+
+    if args.source == "lnd" and (args.macaroonpath is None or args.tlscertpath is None):
+        print("Error: --macaroonpath and --tlscertpath are required for the lnd source")
+        sys.exit(1)
+
+    # Calculate lookback period from revenue window and multiplier
+    lookback_secs = args.revenue_window_secs * args.reputation_multiplier
+    start_ts = int(time.time() - lookback_secs)
+    state = ReputationState(start_ts, args.revenue_window_secs, args.reputation_multiplier)
+
+    server = serve_metrics(state, args.listen_address, args.port)
+    print(f"Serving metrics on http://{args.listen_address}:{args.port}/metrics")
+
+    try:
+        if args.source == "csv":
+            input_csv_file = args.input_csv_file or INPUT_CSV_FILE
+            print(f"Tailing forwards from {input_csv_file}...")
+            run(state, tail_forwards_csv(input_csv_file))
+        else:
+            if args.input_csv_file is not None:
+                print(f"Bootstrapping from {args.input_csv_file}...")
+                run(state, tail_forwards_csv(args.input_csv_file, follow=False))
+                print(f"Applied {state.forwards_processed} historical forwards")
+
+            print(f"Subscribing to HTLC events from {args.restserver}...")
+            run(state, forwards_from_htlc_events(reconnecting(
+                lambda: lnd_htlc_events(args.restserver, args.macaroonpath, args.tlscertpath))))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+from multiprocessing import Pool
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR / "htlc-resolution"))
+sys.path.insert(0, str(REPO_DIR / "utilization"))
+
+import parse_htlc_logs  # noqa: E402
+import calculate_utilization  # noqa: E402
+
+HTLC_RESOLUTION_TIMES = [1, 60]  # seconds, matching reputation_data.sh
+OUTPUT_DIR = "results/fleet"
+
+FORWARDS_FILE = "forwarding_events.csv"
+CHANNELS_FILE = "channel_capacities.csv"
+LOGS_DIR = "logs"
+
+
+def find_node_dirs(fleet_dir):
+    """Find all per-node input directories in the fleet directory, sorted."""
+    return sorted(path for path in Path(fleet_dir).iterdir() if path.is_dir())
+
+
+def process_node(node_dir, resolution_times):
+    """Compute raw resolution counts and utilization bucket times for a single node.
+
+    Inputs that are missing for a node are skipped, and reported as None.
+    """
+    node_dir = Path(node_dir)
+    resolution_stats = None
+    utilization = None
+
+    logs_dir = node_dir / LOGS_DIR
+    log_files = parse_htlc_logs.find_log_files(logs_dir) if logs_dir.is_dir() else []
+    if log_files:
+        add_events, resolve_events = parse_htlc_logs.load_htlc_events(logs_dir)
+        resolution_stats = parse_htlc_logs.calculate_resolution_stats(add_events, resolve_events)
+
+    forwards_file = node_dir / FORWARDS_FILE
+    channels_file = node_dir / CHANNELS_FILE
+    if forwards_file.is_file() and channels_file.is_file():
+        channel_info = calculate_utilization.read_channel_info_from_csv(channels_file)
+        forwards = calculate_utilization.read_forwards_from_csv(forwards_file)
+
+        utilization = {}
+        for resolution_time in resolution_times:
+            channel_distributions = calculate_utilization.calculate_channel_distributions(
+                forwards, channel_info, resolution_time)
+            utilization[resolution_time] = calculate_utilization.aggregate_distributions(
+                channel_distributions)
+
+    return node_dir.name, resolution_stats, utilization
+
+
+def write_reports(output_dir, resolution_stats, utilization):
+    """Write resolution and utilization reports for a node (or the fleet) to output_dir."""
+    if resolution_stats is None and not utilization:
+        return
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if resolution_stats is not None:
+        parse_htlc_logs.generate_report(resolution_stats, output_dir / "htlc_resolution_distribution.txt")
+
+        # Concurrency isn't merged across nodes, so this is only written per node
+        if resolution_stats.get('concurrency') is not None:
+            parse_htlc_logs.write_concurrency_timeline(
+                resolution_stats['concurrency'], output_dir / "htlc_concurrency_timeline.csv")
+
+    for resolution_time, distribution in (utilization or {}).items():
+        label = calculate_utilization.resolution_time_label(resolution_time)
+        calculate_utilization.generate_report(
+            distribution, output_dir / f"channel_utilization_distribution_{label}.txt")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate HTLC resolution and utilization results across a fleet of nodes")
+    parser.add_argument("fleet_dir", help=f"Directory containing one sub-directory per node, each with {LOGS_DIR}/, {FORWARDS_FILE} and {CHANNELS_FILE}")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help=f"Output directory (default: {OUTPUT_DIR})")
+    parser.add_argument("--htlc-resolution-time", type=float, nargs="+", default=HTLC_RESOLUTION_TIMES,
+                        help=f"HTLC resolution time(s) in seconds (default: {' '.join(str(t) for t in HTLC_RESOLUTION_TIMES)})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of nodes to process in parallel (default: number of CPUs)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.fleet_dir):
+        print(f"Error: Fleet directory not found at {args.fleet_dir}")
+        sys.exit(1)
+
+    node_dirs = find_node_dirs(args.fleet_dir)
+    if not node_dirs:
+        print(f"Error: No node directories found in {args.fleet_dir}")
+        sys.exit(1)
+
+    print(f"Processing {len(node_dirs)} nodes with {args.workers} workers...")
+    with Pool(processes=args.workers) as pool:
+        results = pool.starmap(process_node, [(node_dir, args.htlc_resolution_time) for node_dir in node_dirs])
+
+    output_dir = Path(args.output_dir)
+    all_resolution_stats = []
+    all_utilization = {resolution_time: [] for resolution_time in args.htlc_resolution_time}
+
+    for node_name, resolution_stats, utilization in results:
+        if resolution_stats is None:
+            print(f"  - {node_name}: no logs found, skipping HTLC resolution")
+        else:
+            all_resolution_stats.append(resolution_stats)
+
+        if utilization is None:
+            print(f"  - {node_name}: no forwarding history or channel capacities found, skipping utilization")
+        else:
+            for resolution_time, distribution in utilization.items():
+                all_utilization[resolution_time].append(distribution)
+
+        write_reports(output_dir / node_name, resolution_stats, utilization)
+
+    # Merge raw counts and bucket times, so that the combined percentages are exact
+    combined_resolution_stats = None
+    if all_resolution_stats:
+        combined_resolution_stats = parse_htlc_logs.merge_resolution_stats(all_resolution_stats)
+
+    combined_utilization = {
+        resolution_time: calculate_utilization.merge_distributions(distributions)
+        for resolution_time, distributions in all_utilization.items() if distributions
+    }
+
+    write_reports(output_dir, combined_resolution_stats, combined_utilization)
+
+    print(f"Combined results for {len(results)} nodes written to {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
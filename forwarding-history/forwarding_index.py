@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import csv
+import bisect
+import tempfile
+
+# Number of rows between index entries
+INDEX_INTERVAL = 1000
+
+# Bumped whenever the index format changes, so older indexes are rebuilt
+INDEX_HEADER = "# ln-data forwarding index v2"
+
+# Channel columns whose first and last forwards are recorded in the index
+CHANNEL_FIELDS = ("chan_id_in", "chan_id_out")
+
+# Indexes that could not be written, by CSV file, so they are only built once per run
+unwritten_indexes = {}
+
+
+def index_path_for(csv_file):
+    """Location of the sparse index built next to a forwarding CSV."""
+    return f"{csv_file}.idx"
+
+
+def parse_row(header, values):
+    """Build a row dict with the same cleanup as the forwarding CSV readers."""
+    return {key.strip(): value.strip().strip('"') for key, value in zip(header, values)}
+
+
+def source_signature(csv_file):
+    """Size and modification time of the CSV, used to detect a stale index."""
+    stat = os.stat(csv_file)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def build_index(csv_file, interval: int = INDEX_INTERVAL):
+    """Build a sparse timestamp -> byte offset index for a forwarding CSV.
+
+    One entry is recorded every `interval` rows. Seeking is only possible
+    if the CSV is sorted by timestamp (as exported by lnd), so this is
+    recorded alongside the entries. The first and last timestamp of every
+    channel in CHANNEL_FIELDS is recorded too, so that the channels in the
+    data can be counted without reading it.
+    """
+    entries = []
+    is_sorted = True
+    prev_ts = None
+    min_ns = None
+    max_ns = None
+    channels = {field: {} for field in CHANNEL_FIELDS}
+
+    with open(csv_file, 'rb') as f:
+        header_line = f.readline()
+        header = [key.strip() for key in next(csv.reader([header_line.decode('utf-8')]))]
+        ts_col = header.index('timestamp_ns')
+        channel_cols = [(channels[field], header.index(field)) for field in CHANNEL_FIELDS if field in header]
+
+        offset = len(header_line)
+        row_num = 0
+        for line in f:
+            line_offset = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+
+            values = line.split(b',')
+            timestamp_ns = int(values[ts_col].strip().strip(b'"'))
+            if prev_ts is not None and timestamp_ns < prev_ts:
+                is_sorted = False
+            prev_ts = timestamp_ns
+            min_ns = timestamp_ns if min_ns is None else min(min_ns, timestamp_ns)
+            max_ns = timestamp_ns if max_ns is None else max(max_ns, timestamp_ns)
+
+            for field_channels, col in channel_cols:
+                chan_id = values[col].strip().strip(b'"')
+                if not chan_id:
+                    continue
+                seen = field_channels.get(chan_id)
+                if seen is None:
+                    field_channels[chan_id] = [timestamp_ns, timestamp_ns]
+                elif timestamp_ns < seen[0]:
+                    seen[0] = timestamp_ns
+                elif timestamp_ns > seen[1]:
+                    seen[1] = timestamp_ns
+
+            if row_num % interval == 0:
+                entries.append((timestamp_ns, line_offset))
+            row_num += 1
+
+    return entries, {
+        'sorted': is_sorted,
+        'min_ns': min_ns,
+        'max_ns': max_ns,
+        'channels': {
+            field: {chan_id.decode('utf-8'): tuple(seen) for chan_id, seen in field_channels.items()}
+            for field, field_channels in channels.items()
+        },
+    }
+
+
+def write_index(csv_file, entries, meta):
+    """Write index entries and metadata next to a forwarding CSV.
+
+    The index is written to a temporary file and moved into place, so an
+    interrupted write never leaves a partial index behind.
+    """
+    size, mtime_ns = source_signature(csv_file)
+    min_ns = meta['min_ns'] if meta['min_ns'] is not None else ''
+    max_ns = meta['max_ns'] if meta['max_ns'] is not None else ''
+    channel_count = sum(len(field_channels) for field_channels in meta['channels'].values())
+
+    index_file = index_path_for(csv_file)
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(index_file)),
+                                    prefix=os.path.basename(index_file), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', newline='') as f:
+            f.write(f"{INDEX_HEADER} size={size} mtime_ns={mtime_ns} sorted={int(meta['sorted'])} "
+                    f"min_ns={min_ns} max_ns={max_ns} entries={len(entries)} channels={channel_count}\n")
+            writer = csv.writer(f)
+            writer.writerow(["timestamp_ns", "offset"])
+            writer.writerows(entries)
+            writer.writerow(["field", "channel_id", "first_ns", "last_ns"])
+            for field, field_channels in meta['channels'].items():
+                for chan_id, (first_ns, last_ns) in sorted(field_channels.items()):
+                    writer.writerow([field, chan_id, first_ns, last_ns])
+        os.replace(tmp_file, index_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def read_index(csv_file):
+    """Read the index for a forwarding CSV, or return None if it is missing or stale.
+
+    Raises ValueError or StopIteration if the index is malformed.
+    """
+    index_file = index_path_for(csv_file)
+    if not os.path.exists(index_file):
+        return None
+
+    with open(index_file, newline='') as f:
+        meta_line = f.readline().strip()
+        if not meta_line.startswith(INDEX_HEADER + " "):
+            return None
+
+        meta = dict(item.split('=', 1) for item in meta_line[len(INDEX_HEADER):].split())
+        size, mtime_ns = source_signature(csv_file)
+        if int(meta['size']) != size or int(meta['mtime_ns']) != mtime_ns:
+            return None
+
+        reader = csv.reader(f)
+        next(reader)
+        entries = [(int(ts), int(offset)) for ts, offset in
+                   (next(reader) for _ in range(int(meta['entries'])))]
+        next(reader)
+        channels = {field: {} for field in CHANNEL_FIELDS}
+        channel_count = 0
+        for field, chan_id, first_ns, last_ns in reader:
+            channels[field][chan_id] = (int(first_ns), int(last_ns))
+            channel_count += 1
+        if channel_count != int(meta['channels']):
+            raise ValueError(f"expected {meta['channels']} channels, found {channel_count}")
+
+    return entries, {
+        'sorted': meta['sorted'] == '1',
+        'min_ns': int(meta['min_ns']) if meta['min_ns'] else None,
+        'max_ns': int(meta['max_ns']) if meta['max_ns'] else None,
+        'channels': channels,
+    }
+
+
+def load_index(csv_file):
+    """Load the index for a forwarding CSV, (re)building it if missing, stale or malformed.
+
+    Returns the index entries and metadata: whether the CSV is sorted, its
+    minimum and maximum timestamps in nanoseconds (None if empty), and the
+    first and last timestamps of each channel by field.
+    """
+    index_file = index_path_for(csv_file)
+    try:
+        index = read_index(csv_file)
+    except (KeyError, ValueError, StopIteration) as e:
+        print(f"Warning: forwarding index {index_file} is malformed ({e!r}), rebuilding it")
+        index = None
+    if index is not None:
+        return index
+
+    signature = source_signature(csv_file)
+    if csv_file in unwritten_indexes and unwritten_indexes[csv_file][0] == signature:
+        return unwritten_indexes[csv_file][1]
+
+    print(f"Building forwarding index {index_file}...")
+    entries, meta = build_index(csv_file)
+    try:
+        write_index(csv_file, entries, meta)
+    except OSError as e:
+        # Eg, a read-only data directory: keep the index in memory for this
+        # run instead.
+        print(f"Warning: could not write forwarding index {index_file}: {e}")
+        unwritten_indexes[csv_file] = (signature, (entries, meta))
+    return entries, meta
+
+
+def iter_forward_rows(csv_file, start_ts: float = None, end_ts: float = None):
+    """Yield cleaned-up rows from a forwarding CSV with start_ts <= timestamp < end_ts.
+
+    Timestamps are unix seconds. When a window is given, the sparse index
+    is used to seek straight to the first row in range and reading stops
+    after the last one. Without a window, the whole file is read.
+    """
+    for header, values in iter_forward_values(csv_file, start_ts, end_ts):
+        yield parse_row(header, values)
+
+
+def iter_forward_values(csv_file, start_ts: float = None, end_ts: float = None):
+    """Like iter_forward_rows, but yields the header and raw values of each row.
+
+    This skips building a dict for every row, for callers that filter rows
+    before parsing them.
+    """
+    if start_ts is None and end_ts is None:
+        with open(csv_file, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = [key.strip() for key in next(reader)]
+            for values in reader:
+                if values:
+                    yield header, values
+        return
+
+    for _, header, values in iter_window_values(csv_file, [(start_ts, end_ts)]):
+        yield header, values
+
+
+def iter_window_rows(csv_file, windows):
+    """Yield (window index, row) for rows in each of several (start_ts, end_ts) windows.
+
+    Windows are in unix seconds, sorted and non-overlapping, with None for
+    an open start or end. If the CSV is sorted, the sparse index is used to
+    seek to the start of each window so that only rows in (or just before)
+    the windows are read. Otherwise, the whole file is scanned once.
+    """
+    for window_idx, header, values in iter_window_values(csv_file, windows):
+        yield window_idx, parse_row(header, values)
+
+
+def iter_window_values(csv_file, windows):
+    """Like iter_window_rows, but yields the header and raw values of each row."""
+    windows_ns = [
+        (int(start_ts * 1e9) if start_ts is not None else None,
+         int(end_ts * 1e9) if end_ts is not None else None)
+        for start_ts, end_ts in windows
+    ]
+    if not windows_ns:
+        return
+
+    entries, meta = load_index(csv_file)
+
+    with open(csv_file, 'rb') as f:
+        header_line = f.readline()
+        header = [key.strip() for key in next(csv.reader([header_line.decode('utf-8')]))]
+        ts_col = header.index('timestamp_ns')
+
+        if not meta['sorted']:
+            starts = [start_ns if start_ns is not None else -1 for start_ns, _ in windows_ns]
+            for values in csv.reader(line.decode('utf-8') for line in f):
+                if not values:
+                    continue
+                timestamp_ns = int(values[ts_col].strip().strip('"'))
+
+                window_idx = bisect.bisect_right(starts, timestamp_ns) - 1
+                if window_idx < 0:
+                    continue
+                end_ns = windows_ns[window_idx][1]
+                if end_ns is None or timestamp_ns < end_ns:
+                    yield window_idx, header, values
+            return
+
+        for window_idx, (start_ns, end_ns) in enumerate(windows_ns):
+            # Seek to the last indexed row strictly before the window, every
+            # row before it is known to be out of range.
+            offset = len(header_line)
+            if start_ns is not None:
+                pos = bisect.bisect_left(entries, (start_ns, -1)) - 1
+                if pos >= 0:
+                    offset = entries[pos][1]
+            f.seek(offset)
+
+            for values in csv.reader(line.decode('utf-8') for line in f):
+                if not values:
+                    continue
+                timestamp_ns = int(values[ts_col].strip().strip('"'))
+
+                if end_ns is not None and timestamp_ns >= end_ns:
+                    break
+                if start_ns is not None and timestamp_ns < start_ns:
+                    continue
+
+                yield window_idx, header, values
+
+
+def window_time_range(csv_file, start_ts: float = None, end_ts: float = None):
+    """First and last timestamps (in ns) of forwards with start_ts <= timestamp < end_ts, or None if there are none.
+
+    Without a window, this is read from the index. Otherwise, if the CSV is
+    sorted only the rows around the start and end of the window are read.
+    """
+    entries, meta = load_index(csv_file)
+    if start_ts is None and end_ts is None:
+        return (meta['min_ns'], meta['max_ns']) if meta['min_ns'] is not None else None
+
+    if not meta['sorted']:
+        timestamps = [int(values[header.index('timestamp_ns')].strip().strip('"'))
+                      for _, header, values in iter_window_values(csv_file, [(start_ts, end_ts)])]
+        return (min(timestamps), max(timestamps)) if timestamps else None
+
+    first_ns = None
+    for _, header, values in iter_window_values(csv_file, [(start_ts, end_ts)]):
+        first_ns = int(values[header.index('timestamp_ns')].strip().strip('"'))
+        break
+    if first_ns is None:
+        return None
+
+    if end_ts is None:
+        return first_ns, meta['max_ns']
+
+    # The last row in the window is at or after the last indexed row before
+    # its end (less a microsecond, in case converting to seconds rounds up).
+    pos = bisect.bisect_left(entries, (int(end_ts * 1e9), -1)) - 1
+    last_start_ns = max(entries[pos][0], first_ns) if pos >= 0 else first_ns
+    last_ns = first_ns
+    for _, header, values in iter_window_values(csv_file, [((last_start_ns - 1000) / 1e9, end_ts)]):
+        last_ns = max(last_ns, int(values[header.index('timestamp_ns')].strip().strip('"')))
+    return first_ns, last_ns
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} forwarding_events.csv")
+        sys.exit(1)
+
+    csv_file = sys.argv[1]
+    entries, meta = build_index(csv_file)
+    write_index(csv_file, entries, meta)
+    print(f"Wrote {len(entries)} index entries to {index_path_for(csv_file)}")
+    if not meta['sorted']:
+        print("Warning: forwards are not sorted by timestamp, windowed reads will scan the whole file")
+
+
+if __name__ == "__main__":
+    main()
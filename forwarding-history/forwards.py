@@ -0,0 +1,29 @@
+from forwarding_index import iter_forward_rows
+
+
+def parse_forward(row):
+    """Convert a cleaned-up forwarding CSV row into a forward dict."""
+    fwd = {
+        'timestamp': int(row['timestamp_ns']) / 1e9,  # Convert ns to seconds
+        'chan_id_in': row['chan_id_in'],
+        'chan_id_out': row['chan_id_out'],
+        'amt_in_msat': int(row['amt_in_msat']),
+        'amt_out_msat': int(row['amt_out_msat']),
+        'fee_msat': int(row['fee_msat']),
+        'hold_time': None,
+    }
+
+    # Exact hold times joined from logs (see htlc-resolution/join_hold_times.py)
+    if row.get('hold_time_secs'):
+        fwd['hold_time'] = float(row['hold_time_secs'])
+
+    return fwd
+
+
+def load_forwards(input_csv_file: str, start_ts: float = None, end_ts: float = None):
+    """Load forwards from a forwarding CSV, optionally limited to start_ts <= timestamp < end_ts.
+
+    Timestamps are the time that LND recorded the forward (when it settled),
+    in unix seconds.
+    """
+    return [parse_forward(row) for row in iter_forward_rows(input_csv_file, start_ts, end_ts)]
@@ -0,0 +1,178 @@
+import math
+import hashlib
+
+from forwarding_index import iter_forward_values, iter_window_rows, load_index, parse_row, window_time_range
+from forwards import parse_forward
+
+# Ways that forwards can be sampled
+SAMPLE_BY_CHANNEL = "channel"
+SAMPLE_BY_BLOCK = "block"
+SAMPLE_BY = [SAMPLE_BY_CHANNEL, SAMPLE_BY_BLOCK]
+
+BLOCK_SECS = 60 * 60 * 24  # 1 day
+
+# z-score for 95% confidence intervals
+Z_95 = 1.96
+
+# Standard errors are estimated from the spread across sampled units, so
+# they are unreliable with fewer units than this
+MIN_SAMPLED_UNITS = 2
+
+
+class Sampler:
+    """Deterministically selects a fraction of sampling units (channels or time blocks).
+
+    Each unit is included if a hash of its key falls below the sampling
+    fraction, so the same units are selected on every run (for a given
+    seed) and each unit is included independently with probability fraction.
+    """
+    def __init__(self, fraction: float, seed: int = 0):
+        if not 0 < fraction <= 1:
+            raise ValueError(f"Sample fraction must be in (0, 1], got {fraction}")
+        self.fraction = fraction
+        self.seed = seed
+        self.cache = {}
+
+    def includes(self, key) -> bool:
+        if key not in self.cache:
+            digest = hashlib.sha256(f"{self.seed}:{key}".encode('utf-8')).digest()
+            self.cache[key] = int.from_bytes(digest[:8], 'big') / 2**64 < self.fraction
+        return self.cache[key]
+
+
+def load_channel_sample(input_csv_file: str, sampler: Sampler, channel_fields,
+                        start_ts: float = None, end_ts: float = None):
+    """Load forwards where any of channel_fields (eg, 'chan_id_in') is a sampled channel.
+
+    Rows are filtered on their raw values, so that only sampled forwards
+    are fully parsed.
+    """
+    forwards = []
+    columns = None
+    for header, values in iter_forward_values(input_csv_file, start_ts, end_ts):
+        if columns is None:
+            columns = [header.index(field) for field in channel_fields]
+
+        for col in columns:
+            chan_id = values[col].strip().strip('"')
+            if chan_id and sampler.includes(chan_id):
+                forwards.append(parse_forward(parse_row(header, values)))
+                break
+    return forwards
+
+
+def data_time_range(input_csv_file: str, start_ts: float = None, end_ts: float = None):
+    """First and last forward timestamps in the data (within a window), or None if empty.
+
+    This is the span that the full dataset is analyzed over, so sampled
+    estimates are measured over the same period.
+    """
+    time_range = window_time_range(input_csv_file, start_ts, end_ts)
+    if time_range is None:
+        return None
+    return time_range[0] / 1e9, time_range[1] / 1e9
+
+
+def channel_count(input_csv_file: str, channel_fields, start_ts: float = None, end_ts: float = None,
+                  seen_channels=()):
+    """Count the channels that appear in any of channel_fields in forwards within a window.
+
+    This is read from each channel's first and last forward in the index.
+    Channels that forward both before and after the window might not
+    forward within it, so unless they are in seen_channels (eg, channels
+    seen in sampled blocks), the window is read until each of them is found.
+    """
+    _, meta = load_index(input_csv_file)
+    start_ns = int(start_ts * 1e9) if start_ts is not None else None
+    end_ns = int(end_ts * 1e9) if end_ts is not None else None
+
+    active = set(seen_channels)
+    unconfirmed = set()
+    for field in channel_fields:
+        for chan_id, (first_ns, last_ns) in meta['channels'][field].items():
+            if (end_ns is not None and first_ns >= end_ns) or (start_ns is not None and last_ns < start_ns):
+                continue
+            if start_ns is None or first_ns >= start_ns or end_ns is None or last_ns < end_ns:
+                active.add(chan_id)
+            else:
+                unconfirmed.add(chan_id)
+
+    unconfirmed -= active
+    if unconfirmed:
+        columns = None
+        for header, values in iter_forward_values(input_csv_file, start_ts, end_ts):
+            if columns is None:
+                columns = [header.index(field) for field in channel_fields]
+
+            for col in columns:
+                chan_id = values[col].strip().strip('"')
+                if chan_id in unconfirmed:
+                    unconfirmed.discard(chan_id)
+                    active.add(chan_id)
+            if not unconfirmed:
+                break
+
+    return len(active)
+
+
+def sampled_blocks(input_csv_file: str, sampler: Sampler, block_secs: float = BLOCK_SECS,
+                   start_ts: float = None, end_ts: float = None):
+    """List the (start_ts, end_ts) of sampled time blocks covering the forwarding data.
+
+    Blocks are aligned to multiples of block_secs, and clipped to the
+    requested window.
+    """
+    time_range = data_time_range(input_csv_file, start_ts, end_ts)
+    if time_range is None:
+        return []
+    first_ts, last_ts = time_range
+
+    blocks = []
+    block_start = math.floor(first_ts / block_secs) * block_secs
+    while block_start <= last_ts:
+        if sampler.includes(int(block_start)):
+            blocks.append((
+                block_start if start_ts is None else max(block_start, start_ts),
+                block_start + block_secs if end_ts is None else min(block_start + block_secs, end_ts),
+            ))
+        block_start += block_secs
+
+    return blocks
+
+
+def load_block_sample(input_csv_file: str, blocks):
+    """Load forwards in each of the sampled blocks, as one list per block.
+
+    Only the sampled blocks are read, using the forwarding index to seek to
+    each of them.
+    """
+    block_forwards = [[] for _ in blocks]
+    for block_idx, row in iter_window_rows(input_csv_file, blocks):
+        block_forwards[block_idx].append(parse_forward(row))
+    return block_forwards
+
+
+def ht_total(values, fraction: float):
+    """Horvitz-Thompson estimate of a population total from values of sampled units.
+
+    Returns the estimate and its standard error, for units that were each
+    sampled independently with probability fraction.
+    """
+    estimate = sum(values) / fraction
+    variance = (1 - fraction) / fraction ** 2 * sum(value ** 2 for value in values)
+    return estimate, math.sqrt(variance)
+
+
+def ht_ratio(numerators, denominators, fraction: float):
+    """Estimate the ratio of two population totals from sampled units.
+
+    Returns the estimate and its (linearized) standard error.
+    """
+    total_denominator = sum(denominators)
+    if total_denominator == 0:
+        return 0.0, 0.0
+
+    ratio = sum(numerators) / total_denominator
+    residuals = [num - ratio * den for num, den in zip(numerators, denominators)]
+    _, residual_se = ht_total(residuals, fraction)
+    return ratio, residual_se / (total_denominator / fraction)
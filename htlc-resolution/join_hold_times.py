@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import csv
+import argparse
+from collections import defaultdict, deque
+
+from parse_htlc_logs import find_log_files, load_htlc_events, match_htlc_events
+
+# Maximum difference between a forward's timestamp and the settle of its
+# outgoing HTLC in the logs for the two to be joined.
+MATCH_TOLERANCE = 2.0  # seconds
+
+HOLD_TIME_COLUMN = "hold_time_secs"
+
+
+def match_hold_times(forwards, settled_htlcs, tolerance: float = MATCH_TOLERANCE):
+    """Join forwards to settled HTLCs by time proximity and amount.
+
+    Forwards are (timestamp, amt_out_msat) tuples, and lnd records a forward
+    when its outgoing HTLC settles. Both sides are sorted by time and merged,
+    keeping only HTLCs within the tolerance window of the current forward,
+    grouped by amount. Each forward is matched to the closest unmatched HTLC
+    with the same amount (or with no logged amount), so the join runs in
+    O(n log n) for the sorts plus O(n * w) for w HTLCs in a window.
+
+    Returns a list of hold times in seconds (or None if no match was found)
+    in the same order as forwards.
+    """
+    htlcs = sorted(settled_htlcs, key=lambda h: h['resolve_timestamp'])
+    forward_order = sorted(range(len(forwards)), key=lambda i: forwards[i][0])
+
+    # HTLCs in the current window, by amount, in resolve time order
+    window = defaultdict(deque)
+    matched = [False] * len(htlcs)
+    next_htlc = 0
+
+    hold_times = [None] * len(forwards)
+    for fwd_idx in forward_order:
+        timestamp, amt_msat = forwards[fwd_idx]
+
+        while next_htlc < len(htlcs) and htlcs[next_htlc]['resolve_timestamp'] <= timestamp + tolerance:
+            window[htlcs[next_htlc]['amt_msat']].append(next_htlc)
+            next_htlc += 1
+
+        best = None
+        for amt_key in (amt_msat, None):
+            candidates = window.get(amt_key)
+            if not candidates:
+                continue
+
+            # Drop HTLCs that have been matched or fallen out of the window
+            while candidates and (matched[candidates[0]] or
+                                  htlcs[candidates[0]]['resolve_timestamp'] < timestamp - tolerance):
+                candidates.popleft()
+            if not candidates:
+                del window[amt_key]
+                continue
+
+            for htlc_idx in candidates:
+                if matched[htlc_idx]:
+                    continue
+                diff = htlcs[htlc_idx]['resolve_timestamp'] - timestamp
+                if best is not None and diff > best[0]:
+                    break
+                if best is None or abs(diff) < best[0]:
+                    best = (abs(diff), htlc_idx)
+
+            if best is not None:
+                break
+
+        if best is not None:
+            htlc = htlcs[best[1]]
+            matched[best[1]] = True
+            hold_times[fwd_idx] = htlc['resolve_timestamp'] - htlc['add_timestamp']
+
+    return hold_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add exact HTLC hold times from LND logs to forwarding history")
+    parser.add_argument("logs_dir", help="Directory containing LND logs")
+    parser.add_argument("input_csv_file", help="Forwarding events CSV file")
+    parser.add_argument("--output", default="forwarding_events_hold_times.csv",
+                        help="Output CSV file (default: forwarding_events_hold_times.csv)")
+    parser.add_argument("--tolerance", type=float, default=MATCH_TOLERANCE,
+                        help=f"Maximum time difference in seconds between a forward and its settled HTLC (default: {MATCH_TOLERANCE})")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.logs_dir):
+        print(f"Error: Logs directory not found at {args.logs_dir}")
+        sys.exit(1)
+
+    log_files = find_log_files(args.logs_dir)
+    if not log_files:
+        print(f"Error: No log files found in {args.logs_dir}")
+        sys.exit(1)
+
+    print(f"Processing LND logs from {args.logs_dir}...")
+    add_events, resolve_events = load_htlc_events(args.logs_dir)
+    resolved, _, _ = match_htlc_events(add_events, resolve_events)
+
+    # Only settled HTLCs appear in forwarding history
+    settled = [htlc for htlc in resolved if htlc['outcome'] == "SETTLE"]
+    print(f"Found {len(settled)} settled HTLCs")
+
+    print(f"Loading forwards from {args.input_csv_file}...")
+    with open(args.input_csv_file, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = [key.strip() for key in next(reader)]
+        rows = [[value.strip().strip('"') for value in row] for row in reader if row]
+    print(f"Loaded {len(rows)} forwards")
+
+    ts_col = header.index('timestamp_ns')
+    amt_col = header.index('amt_out_msat')
+    forwards = [(int(row[ts_col]) / 1e9, int(row[amt_col])) for row in rows]
+
+    print("Joining forwards with settled HTLCs...")
+    hold_times = match_hold_times(forwards, settled, args.tolerance)
+
+    with open(args.output, 'w', newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header + [HOLD_TIME_COLUMN])
+        for row, hold_time in zip(rows, hold_times):
+            writer.writerow(row + ["" if hold_time is None else f"{hold_time:.3f}"])
+
+    matched_count = sum(1 for hold_time in hold_times if hold_time is not None)
+    print(f"Matched {matched_count} of {len(rows)} forwards")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,12 @@ from datetime import datetime
 from collections import defaultdict
 from pathlib import Path
 
+# Resolution time buckets, matching bucket_resolution_time
+RESOLUTION_BUCKETS = ["< 1s", "< 5s", "< 10s", "< 30s", "< 1min", "< 90s", "< 2min", "< 3min", "< 5min", "> 5min"]
+
+# Concurrent in-flight HTLC buckets (upper bound of each range)
+CONCURRENCY_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 483]
+
 
 def parse_timestamp(ts_str):
     """Parse timestamp string to seconds since epoch (float)."""
@@ -42,6 +48,8 @@ def extract_add_events(log_lines):
         r'id=(\d+).*?'
         r'hash=([0-9a-f]+)'
     )
+    # Amount is logged as amt=<msat> mSAT, but is optional
+    amt_pattern = re.compile(r'amt=(\d+) mSAT')
 
     events = []
     for line in log_lines:
@@ -51,10 +59,12 @@ def extract_add_events(log_lines):
                 timestamp_str = match.group(1)
                 htlc_id = match.group(2)
                 hash_val = match.group(3)
+                amt_match = amt_pattern.search(line)
                 events.append({
                     'timestamp': parse_timestamp(timestamp_str),
                     'htlc_id': htlc_id,
-                    'hash': hash_val
+                    'hash': hash_val,
+                    'amt_msat': int(amt_match.group(1)) if amt_match else None
                 })
 
     return events
@@ -89,6 +99,15 @@ def extract_resolve_events(log_lines):
     return events
 
 
+def load_htlc_events(logs_dir):
+    """Read all LND logs in logs_dir and extract HTLC add and resolve events."""
+    all_lines = []
+    for log_file in find_log_files(logs_dir):
+        all_lines.extend(read_log_file(log_file))
+
+    return extract_add_events(all_lines), extract_resolve_events(all_lines)
+
+
 def bucket_resolution_time(seconds):
     """Bucket resolution time into predefined buckets."""
     if seconds < 1:
@@ -113,45 +132,152 @@ def bucket_resolution_time(seconds):
         return "> 5min"
 
 
-def calculate_resolution_stats(add_events, resolve_events):
-    """Match add and resolve events, calculate resolution times."""
+def match_htlc_events(add_events, resolve_events):
+    """Match add and resolve events for the same outgoing HTLC.
+
+    Returns a list of resolved HTLCs (with add and resolve timestamps), the
+    number of resolve events without a matching add and the add events
+    that were never resolved.
+    """
     # Build index of add events: key = hash:htlc_id
-    add_times = {}
+    adds = {}
     for event in add_events:
         key = f"{event['hash']}:{event['htlc_id']}"
-        add_times[key] = event['timestamp']
+        adds[key] = event
 
-    # Define buckets
-    buckets = ["< 1s", "< 5s", "< 10s", "< 30s", "< 1min", "< 90s", "< 2min", "< 3min", "< 5min", "> 5min"]
-    settle_buckets = {bucket: 0 for bucket in buckets}
-    fail_buckets = {bucket: 0 for bucket in buckets}
-
-    settle_total = 0
-    fail_total = 0
+    resolved = []
     unmatched = 0
 
     # Process resolve events
     for event in resolve_events:
         key = f"{event['hash']}:{event['htlc_id']}"
 
-        if key in add_times:
-            resolution_time = event['timestamp'] - add_times[key]
-            bucket = bucket_resolution_time(resolution_time)
-
-            if event['outcome'] == "SETTLE":
-                settle_buckets[bucket] += 1
-                settle_total += 1
-            else:  # FAIL
-                fail_buckets[bucket] += 1
-                fail_total += 1
+        if key in adds:
+            add_event = adds[key]
+            resolved.append({
+                'add_timestamp': add_event['timestamp'],
+                'resolve_timestamp': event['timestamp'],
+                'outcome': event['outcome'],
+                'amt_msat': add_event.get('amt_msat')
+            })
 
             # Remove matched event
-            del add_times[key]
+            del adds[key]
         else:
             unmatched += 1
 
-    # Count unresolved HTLCs (add events with no matching resolve)
-    unresolved = len(add_times)
+    return resolved, unmatched, list(adds.values())
+
+
+def bucket_concurrency(count):
+    """Bucket a number of concurrent in-flight HTLCs."""
+    for bucket in CONCURRENCY_BUCKETS:
+        if count <= bucket:
+            return bucket
+    return ">max"
+
+
+def format_concurrency_bucket(bucket):
+    """Format concurrency bucket for display."""
+    if bucket == ">max":
+        return f"> {CONCURRENCY_BUCKETS[-1]}"
+    idx = CONCURRENCY_BUCKETS.index(bucket)
+    if idx == 0 or CONCURRENCY_BUCKETS[idx - 1] + 1 == bucket:
+        return f"{bucket}"
+    return f"{CONCURRENCY_BUCKETS[idx - 1] + 1}-{bucket}"
+
+
+def sweep_concurrency(deltas, end_ts):
+    """Sweep difference counters to build a timeline of concurrent in-flight HTLCs.
+
+    deltas maps a timestamp to the net change in in-flight HTLCs at that
+    time (+1 for each add, -1 for each resolve). Returns the peak and the
+    time spent in each concurrency bucket, overall and per hour.
+    """
+    distribution = {bucket: 0.0 for bucket in CONCURRENCY_BUCKETS + [">max"]}
+    hourly = {}
+    peak = 0
+    peak_ts = None
+
+    def record(start, end, level):
+        """Attribute a period at a fixed concurrency level to its hours."""
+        distribution[bucket_concurrency(level)] += end - start
+        while start < end:
+            hour_start = (start // 3600) * 3600
+            segment_end = min(end, hour_start + 3600)
+            hour = hourly.setdefault(hour_start, {'weighted': 0.0, 'time': 0.0, 'peak': 0})
+            hour['weighted'] += level * (segment_end - start)
+            hour['time'] += segment_end - start
+            hour['peak'] = max(hour['peak'], level)
+            start = segment_end
+
+    level = 0
+    prev_ts = None
+    for timestamp in sorted(deltas):
+        if prev_ts is not None:
+            record(prev_ts, timestamp, level)
+
+        level += deltas[timestamp]
+        if level > peak:
+            peak = level
+            peak_ts = timestamp
+        prev_ts = timestamp
+
+    if prev_ts is not None and end_ts > prev_ts:
+        record(prev_ts, end_ts, level)
+
+    return {
+        'peak': peak,
+        'peak_timestamp': peak_ts,
+        'distribution': distribution,
+        'hourly': [
+            {
+                'hour': hour_start,
+                'average': hour['weighted'] / hour['time'] if hour['time'] > 0 else 0.0,
+                'peak': hour['peak']
+            }
+            for hour_start, hour in sorted(hourly.items())
+        ]
+    }
+
+
+def calculate_resolution_stats(add_events, resolve_events):
+    """Match add and resolve events, calculate resolution times and in-flight concurrency."""
+    resolved, unmatched, unresolved_adds = match_htlc_events(add_events, resolve_events)
+
+    # Difference counters for the number of HTLCs in flight across the node
+    deltas = defaultdict(int)
+    end_ts = None
+
+    settle_buckets = {bucket: 0 for bucket in RESOLUTION_BUCKETS}
+    fail_buckets = {bucket: 0 for bucket in RESOLUTION_BUCKETS}
+
+    settle_total = 0
+    fail_total = 0
+
+    for htlc in resolved:
+        resolution_time = htlc['resolve_timestamp'] - htlc['add_timestamp']
+        bucket = bucket_resolution_time(resolution_time)
+
+        deltas[htlc['add_timestamp']] += 1
+        deltas[htlc['resolve_timestamp']] -= 1
+        if end_ts is None or htlc['resolve_timestamp'] > end_ts:
+            end_ts = htlc['resolve_timestamp']
+
+        if htlc['outcome'] == "SETTLE":
+            settle_buckets[bucket] += 1
+            settle_total += 1
+        else:  # FAIL
+            fail_buckets[bucket] += 1
+            fail_total += 1
+
+    # Count unresolved HTLCs (add events with no matching resolve), these
+    # are in flight until the end of the logs.
+    unresolved = len(unresolved_adds)
+    for event in unresolved_adds:
+        deltas[event['timestamp']] += 1
+        if end_ts is None or event['timestamp'] > end_ts:
+            end_ts = event['timestamp']
 
     return {
         'settle_buckets': settle_buckets,
@@ -159,9 +285,34 @@ def calculate_resolution_stats(add_events, resolve_events):
         'settle_total': settle_total,
         'fail_total': fail_total,
         'unmatched': unmatched,
-        'unresolved': unresolved
+        'unresolved': unresolved,
+        'concurrency': sweep_concurrency(deltas, end_ts)
+    }
+
+
+def merge_resolution_stats(stats_list):
+    """Merge resolution stats (eg, from several nodes) by summing raw counts.
+
+    Concurrency is specific to each node, so it is not merged.
+    """
+    merged = {
+        'settle_buckets': {bucket: 0 for bucket in RESOLUTION_BUCKETS},
+        'fail_buckets': {bucket: 0 for bucket in RESOLUTION_BUCKETS},
+        'settle_total': 0,
+        'fail_total': 0,
+        'unmatched': 0,
+        'unresolved': 0
     }
 
+    for stats in stats_list:
+        for bucket in RESOLUTION_BUCKETS:
+            merged['settle_buckets'][bucket] += stats['settle_buckets'][bucket]
+            merged['fail_buckets'][bucket] += stats['fail_buckets'][bucket]
+        for key in ('settle_total', 'fail_total', 'unmatched', 'unresolved'):
+            merged[key] += stats[key]
+
+    return merged
+
 
 def format_percentage(value, total):
     """Format percentage with appropriate decimal places."""
@@ -181,8 +332,6 @@ def generate_report(stats, output_file):
     unmatched = stats['unmatched']
     unresolved = stats['unresolved']
 
-    buckets = ["< 1s", "< 5s", "< 10s", "< 30s", "< 1min", "< 90s", "< 2min", "< 3min", "< 5min", "> 5min"]
-
     lines = []
     lines.append("HTLC Resolution Time Distribution")
     lines.append("==================================")
@@ -206,7 +355,7 @@ def generate_report(stats, output_file):
     lines.append("-------------------")
     lines.append(f"{'Bucket':<10} {'Count':>8} {'Percent':>8}")
 
-    for bucket in buckets:
+    for bucket in RESOLUTION_BUCKETS:
         count = settle_buckets[bucket]
         pct = format_percentage(count, settle_total)
         lines.append(f"{bucket:<10} {count:>8} {pct:>7.1f}%")
@@ -218,11 +367,32 @@ def generate_report(stats, output_file):
     lines.append("-----------------")
     lines.append(f"{'Bucket':<10} {'Count':>8} {'Percent':>8}")
 
-    for bucket in buckets:
+    for bucket in RESOLUTION_BUCKETS:
         count = fail_buckets[bucket]
         pct = format_percentage(count, fail_total)
         lines.append(f"{bucket:<10} {count:>8} {pct:>7.1f}%")
 
+    # Concurrency distribution, only available for a single node
+    concurrency = stats.get('concurrency')
+    if concurrency is not None:
+        distribution = concurrency['distribution']
+        total_time = sum(distribution.values())
+
+        lines.append("")
+        lines.append("Concurrent In-Flight HTLCs:")
+        lines.append("---------------------------")
+        if concurrency['peak_timestamp'] is not None:
+            peak_time = datetime.fromtimestamp(concurrency['peak_timestamp']).strftime("%Y-%m-%d %H:%M:%S")
+            lines.append(f"Peak: {concurrency['peak']} at {peak_time}")
+        else:
+            lines.append("Peak: 0")
+        lines.append(f"{'HTLCs':<10} {'Time (seconds)':>15} {'Percent':>8}")
+
+        for bucket in CONCURRENCY_BUCKETS + [">max"]:
+            time_val = distribution[bucket]
+            pct = format_percentage(time_val, total_time)
+            lines.append(f"{format_concurrency_bucket(bucket):<10} {time_val:>15.0f} {pct:>7.1f}%")
+
     # Write to file
     report = "\n".join(lines)
     with open(output_file, 'w') as f:
@@ -231,17 +401,27 @@ def generate_report(stats, output_file):
     return report
 
 
+def write_concurrency_timeline(concurrency, output_file):
+    """Write the hourly time-weighted average and peak in-flight HTLCs to a CSV file."""
+    with open(output_file, 'w') as f:
+        f.write("hour,average_in_flight,peak_in_flight\n")
+        for hour in concurrency['hourly']:
+            hour_label = datetime.fromtimestamp(hour['hour']).strftime("%Y-%m-%d %H:00")
+            f.write(f"{hour_label},{hour['average']:.3f},{hour['peak']}\n")
+
+
 def main():
     # Parse arguments
     logs_dir = sys.argv[1] if len(sys.argv) > 1 else "htlc-resolution/logs"
     output_file = sys.argv[2] if len(sys.argv) > 2 else "htlc_resolution_distribution.txt"
+    timeline_file = sys.argv[3] if len(sys.argv) > 3 else "htlc_concurrency_timeline.csv"
 
     # Check if logs directory exists
     if not os.path.isdir(logs_dir):
         print(f"Error: Logs directory not found at {logs_dir}")
         print("")
-        print(f"Usage: {sys.argv[0]} [logs-directory] [output-file]")
-        print(f"Example: {sys.argv[0]} logs htlc_resolution_distribution.txt")
+        print(f"Usage: {sys.argv[0]} [logs-directory] [output-file] [timeline-file]")
+        print(f"Example: {sys.argv[0]} logs htlc_resolution_distribution.txt htlc_concurrency_timeline.csv")
         print("")
         print("Note: Please copy your LND logs into the ./logs directory first")
         sys.exit(1)
@@ -260,27 +440,10 @@ def main():
         print(f"  - {log_file.name}")
     print("")
 
-    # Read and combine all log files
-    print("Combining log files in chronological order...")
-    all_lines = []
-    for log_file in log_files:
-        if log_file.suffix == ".gz":
-            print(f"Processing gzipped: {log_file.name}")
-        else:
-            print(f"Processing regular: {log_file.name}")
-
-        lines = read_log_file(log_file)
-        all_lines.extend(lines)
-
-    print(f"Combined log size: {len(all_lines)} lines")
-    print("")
-
     # Extract events
     print("Extracting HTLC events...")
-    add_events = extract_add_events(all_lines)
+    add_events, resolve_events = load_htlc_events(logs_dir)
     print(f"Found {len(add_events)} 'Sending UpdateAddHTLC' events")
-
-    resolve_events = extract_resolve_events(all_lines)
     print(f"Found {len(resolve_events)} 'Closed completed SETTLE/FAIL circuit' events")
     print("")
 
@@ -290,9 +453,11 @@ def main():
 
     # Generate report
     generate_report(stats, output_file)
+    write_concurrency_timeline(stats['concurrency'], timeline_file)
 
     print("")
     print(f"Results written to {output_file}")
+    print(f"Concurrency timeline written to {timeline_file}")
 
 
 if __name__ == "__main__":
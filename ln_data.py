@@ -0,0 +1,82 @@
+"""Library API for analyzing LND data in-process.
+
+The scripts in this repo are thin command line wrappers around the
+functions exported here. Loading functions return lists and dicts, and
+analysis functions accept any iterable of them, so a dataset that is
+loaded once can be reused across many analyses:
+
+    import ln_data
+
+    forwards = ln_data.load_forwards("forwarding_events.csv")
+    channel_info = ln_data.load_channel_info("channel_capacities.csv")
+
+    scores = ln_data.compute_reputation(forwards, revenue_window_secs=1209600)
+    for resolution_time in (1, 60):
+        utilization = ln_data.simulate_utilization(forwards, channel_info, resolution_time)
+
+    add_events, resolve_events = ln_data.load_htlc_events("htlc-resolution/logs")
+    stats = ln_data.compute_resolution_stats(add_events, resolve_events)
+"""
+
+import os
+import sys
+import importlib
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TOOL_DIRS = ("forwarding-history", "channel-reputation", "utilization", "htlc-resolution")
+
+# Top-level modules of the tools, which import each other by these names
+TOOL_MODULES = (
+    "forwarding_index",
+    "forwards",
+    "sampling",
+    "reputation",
+    "calculate_utilization",
+    "parse_htlc_logs",
+    "join_hold_times",
+)
+
+
+def _import_tools():
+    """Import the tool modules without changing how the caller resolves its own imports.
+
+    The tool directories are only on sys.path while importing, and the
+    generic module names (eg, `forwards`) are removed from sys.modules
+    again afterwards, restoring any of the caller's modules with the
+    same names.
+    """
+    saved_path = list(sys.path)
+    saved_modules = {name: sys.modules.pop(name) for name in TOOL_MODULES if name in sys.modules}
+    sys.path[:0] = [os.path.join(REPO_DIR, tool_dir) for tool_dir in TOOL_DIRS]
+    try:
+        return {name: importlib.import_module(name) for name in TOOL_MODULES}
+    finally:
+        sys.path[:] = saved_path
+        for name in TOOL_MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved_modules)
+
+
+_tools = _import_tools()
+
+load_forwards = _tools["forwards"].load_forwards
+compute_reputation = _tools["reputation"].compute_reputation
+load_channel_info = _tools["calculate_utilization"].read_channel_info_from_csv
+simulate_utilization = _tools["calculate_utilization"].simulate_utilization
+merge_distributions = _tools["calculate_utilization"].merge_distributions
+load_htlc_events = _tools["parse_htlc_logs"].load_htlc_events
+compute_resolution_stats = _tools["parse_htlc_logs"].calculate_resolution_stats
+merge_resolution_stats = _tools["parse_htlc_logs"].merge_resolution_stats
+match_hold_times = _tools["join_hold_times"].match_hold_times
+
+__all__ = [
+    "load_forwards",
+    "load_channel_info",
+    "load_htlc_events",
+    "compute_reputation",
+    "simulate_utilization",
+    "merge_distributions",
+    "compute_resolution_stats",
+    "merge_resolution_stats",
+    "match_hold_times",
+]
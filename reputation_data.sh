@@ -55,7 +55,7 @@ if [ ! -d "htlc-resolution/logs" ] || [ -z "$(ls -A htlc-resolution/logs/*.log*
 fi
 
 cd htlc-resolution
-$PYTHON_CMD parse_htlc_logs.py logs ../results/htlc_resolution_distribution.txt
+$PYTHON_CMD parse_htlc_logs.py logs ../results/htlc_resolution_distribution.txt ../results/htlc_concurrency_timeline.csv
 cd ..
 
 # Step 2: Pull forwarding history
@@ -122,6 +122,7 @@ echo "Results generated:"
 echo "  - forwarding-history/forwarding_events.csv"
 echo "  - channel-capacity/channel_capacities.csv"
 echo "  - results/htlc_resolution_distribution.txt"
+echo "  - results/htlc_concurrency_timeline.csv"
 echo "  - results/channel_scores_*days_*days.csv"
 echo "  - results/channel_utilization_distribution_1s.txt"
 echo "  - results/channel_utilization_distribution_60s.txt"
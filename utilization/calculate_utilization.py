@@ -1,11 +1,32 @@
 #!/usr/bin/env python3
 
+import os
 import csv
 import argparse
 import heapq
 from collections import defaultdict
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "forwarding-history"))
+
+from forwards import load_forwards  # noqa: E402
+from sampling import (  # noqa: E402
+    SAMPLE_BY,
+    SAMPLE_BY_CHANNEL,
+    SAMPLE_BY_BLOCK,
+    BLOCK_SECS,
+    Z_95,
+    MIN_SAMPLED_UNITS,
+    Sampler,
+    load_channel_sample,
+    sampled_blocks,
+    load_block_sample,
+    channel_count,
+    data_time_range,
+    ht_total,
+    ht_ratio,
+)
+
 HTLC_RESOLUTION_TIME = 60  # seconds
 
 # Slot buckets (exact counts)
@@ -60,8 +81,9 @@ class DirectionalHTLCManager:
         self.current_liquidity_in = defaultdict(float)
         self.current_liquidity_out = defaultdict(float)
 
-    def add_htlc(self, timestamp: float, channel_id: str, amount_msat: int, direction: str):
-        resolution_ts = timestamp + self.resolution_time
+    def add_htlc(self, timestamp: float, channel_id: str, amount_msat: int, direction: str,
+                 hold_time: float = None):
+        resolution_ts = timestamp + (self.resolution_time if hold_time is None else hold_time)
         heapq.heappush(self.pending_resolutions, (resolution_ts, amount_msat, channel_id, direction))
 
         if direction == 'in':
@@ -97,20 +119,21 @@ class DirectionalHTLCManager:
         )
 
 
-def read_forwards_from_csv(input_csv_file: str):
-    forwards = []
-    with open(input_csv_file, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            row = {key.strip(): value.strip().strip('"') for key, value in row.items()}
-            forwards.append({
-                'timestamp': int(row['timestamp_ns']) / 1e9,
-                'chan_id_in': row['chan_id_in'],
-                'chan_id_out': row['chan_id_out'],
-                'amt_in_msat': int(row['amt_in_msat']),
-                'amt_out_msat': int(row['amt_out_msat']),
-            })
-    return forwards
+def read_forwards_from_csv(input_csv_file: str, start_ts: float = None, end_ts: float = None):
+    return load_forwards(input_csv_file, start_ts, end_ts)
+
+
+def htlc_add_time(fwd):
+    """Time that a forward's HTLC was added.
+
+    LND records forwards when they settle, so if an exact hold time was
+    joined from logs (see htlc-resolution/join_hold_times.py) the HTLC was
+    added that long before the forward's timestamp. Otherwise, the forward's
+    timestamp is used.
+    """
+    if fwd.get('hold_time') is not None:
+        return fwd['timestamp'] - fwd['hold_time']
+    return fwd['timestamp']
 
 
 def read_channel_info_from_csv(channel_info_file: str):
@@ -198,49 +221,44 @@ def format_liquidity_bucket(bucket):
     return f"{bucket}%"
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Calculate channel utilization distributions")
-    parser.add_argument("input_csv_file", help="Forwarding events CSV file")
-    parser.add_argument("channel_info_file", help="Channel capacity info CSV file")
-    parser.add_argument("--output", default=None, help="Output file (default: auto-generated based on resolution time)")
-    parser.add_argument("--htlc-resolution-time", type=float, default=HTLC_RESOLUTION_TIME,
-                        help=f"HTLC resolution time in seconds (default: {HTLC_RESOLUTION_TIME})")
-    args = parser.parse_args()
-
-    # Generate output filename if not specified
-    if args.output is None:
-        resolution_time_label = f"{int(args.htlc_resolution_time)}s" if args.htlc_resolution_time >= 1 else f"{args.htlc_resolution_time:.1f}s"
-        args.output = f"channel_utilization_distribution_{resolution_time_label}.txt"
+def empty_bucket_times(buckets):
+    """Create a zeroed bucket -> time mapping, including the overflow bucket."""
+    bucket_times = {bucket: 0.0 for bucket in buckets}
+    bucket_times[">max"] = 0.0
+    return bucket_times
 
-    # Load channel info
-    print(f"Loading channel info from {args.channel_info_file}...")
-    channel_info = read_channel_info_from_csv(args.channel_info_file)
-    print(f"Loaded info for {len(channel_info)} channels")
 
-    # Load forwards
-    print(f"Loading forwards from {args.input_csv_file}...")
-    forwards = read_forwards_from_csv(args.input_csv_file)
-    print(f"Loaded {len(forwards)} forwards")
+def calculate_channel_distributions(forwards, channel_info, resolution_time: float, time_range=None):
+    """Simulate HTLC utilization and return the time each incoming channel spent in each bucket.
 
+    Forwards may be any iterable, and are processed in the order that their
+    HTLCs were added. Channels are observed from the first forward to the
+    last, or over time_range (first, last timestamp) if given, eg, when
+    forwards are a sample of a larger dataset. Returns a mapping of channel
+    id to a dict with slot bucket times, liquidity bucket times and
+    observation time.
+    """
+    forwards = sorted(forwards, key=htlc_add_time)
     if len(forwards) == 0:
-        print("No forwards found.")
-        return
+        return {}
 
-    # Sort by timestamp
-    forwards.sort(key=lambda x: x['timestamp'])
+    actual_start_ts = htlc_add_time(forwards[0])
+    actual_end_ts = htlc_add_time(forwards[-1])
+    if time_range is not None:
+        actual_start_ts = min(actual_start_ts, time_range[0])
+        actual_end_ts = max(actual_end_ts, time_range[1])
 
-    actual_start_ts = forwards[0]['timestamp']
-    actual_end_ts = forwards[-1]['timestamp']
+    # Longest time that any HTLC is held, for exact hold times
+    max_hold_time = max([resolution_time] + [
+        fwd['hold_time'] for fwd in forwards if fwd.get('hold_time') is not None])
 
     # Initialize tracking (only for incoming channels)
     slot_states = {}
     liquidity_states = {}
-    htlc_manager = DirectionalHTLCManager(args.htlc_resolution_time)
-
-    print("Processing forwards...")
+    htlc_manager = DirectionalHTLCManager(resolution_time)
 
     for fwd in forwards:
-        timestamp = fwd['timestamp']
+        timestamp = htlc_add_time(fwd)
         amt_in_msat = fwd['amt_in_msat']
 
         # Process HTLC resolutions
@@ -266,7 +284,7 @@ def main():
                 slot_states[chan_in] = StateTracker(0, actual_start_ts)
                 liquidity_states[chan_in] = StateTracker(0.0, actual_start_ts)
 
-            htlc_manager.add_htlc(timestamp, chan_in, amt_in_msat, 'out')
+            htlc_manager.add_htlc(timestamp, chan_in, amt_in_msat, 'out', fwd.get('hold_time'))
 
             slots_in, slots_out, liq_in, liq_out = htlc_manager.get_current_state(chan_in)
             total_slots = slots_in + slots_out
@@ -280,7 +298,7 @@ def main():
                 liquidity_states[chan_in].add_state_change(timestamp, liq_pct)
 
     # Process final resolutions
-    final_time = actual_end_ts + args.htlc_resolution_time * 2
+    final_time = actual_end_ts + max_hold_time * 2
     resolutions = htlc_manager.process_resolutions(final_time)
     for resolution_ts, chan_id, resolved_amt, direction in resolutions:
         slots_in, slots_out, liq_in, liq_out = htlc_manager.get_current_state(chan_id)
@@ -295,41 +313,71 @@ def main():
             liq_pct = (total_liq / capacity_msat) * 100 if capacity_msat > 0 else 0
             liquidity_states[chan_id].add_state_change(resolution_ts, liq_pct)
 
-    # Calculate distributions
-    print("Calculating distributions...")
+    distributions = {}
+    for chan_id in sorted(slot_states.keys()):
+        slot_times, chan_time = slot_states[chan_id].calculate_time_in_buckets(
+            final_time, SLOT_BUCKETS, slot_bucket_fn)
+        liq_times, _ = liquidity_states[chan_id].calculate_time_in_buckets(
+            final_time, LIQUIDITY_BUCKETS, liquidity_bucket_fn)
+        distributions[chan_id] = {
+            'slot_bucket_times': slot_times,
+            'liq_bucket_times': liq_times,
+            'total_time': chan_time,
+        }
 
-    all_channels = sorted(slot_states.keys())
+    return distributions
 
-    # Aggregate across all channels
-    slot_bucket_times = {bucket: 0.0 for bucket in SLOT_BUCKETS}
-    slot_bucket_times[">max"] = 0.0
 
-    liq_bucket_times = {bucket: 0.0 for bucket in LIQUIDITY_BUCKETS}
-    liq_bucket_times[">max"] = 0.0
+def aggregate_distributions(channel_distributions):
+    """Sum per-channel bucket times into a single distribution."""
+    return merge_distributions(
+        dict(dist, channel_count=1) for dist in channel_distributions.values()
+    )
 
-    total_time = 0.0
 
-    for chan_id in all_channels:
-        # Slots
-        bucket_times, chan_time = slot_states[chan_id].calculate_time_in_buckets(
-            final_time, SLOT_BUCKETS, slot_bucket_fn)
-        for bucket, time_val in bucket_times.items():
-            slot_bucket_times[bucket] += time_val
+def merge_distributions(distributions):
+    """Merge aggregated distributions (eg, from several nodes) by summing raw bucket times."""
+    merged = {
+        'slot_bucket_times': empty_bucket_times(SLOT_BUCKETS),
+        'liq_bucket_times': empty_bucket_times(LIQUIDITY_BUCKETS),
+        'total_time': 0.0,
+        'channel_count': 0,
+    }
+
+    for dist in distributions:
+        for bucket, time_val in dist['slot_bucket_times'].items():
+            merged['slot_bucket_times'][bucket] += time_val
+        for bucket, time_val in dist['liq_bucket_times'].items():
+            merged['liq_bucket_times'][bucket] += time_val
+        merged['total_time'] += dist['total_time']
+        merged['channel_count'] += dist['channel_count']
+
+    return merged
+
+
+def simulate_utilization(forwards, channel_info, resolution_time: float = HTLC_RESOLUTION_TIME, time_range=None):
+    """Simulate incoming channel utilization for forwards.
+
+    Returns the aggregated slot and liquidity bucket times across all
+    incoming channels, with the per-channel distributions under 'channels'.
+    """
+    channel_distributions = calculate_channel_distributions(forwards, channel_info, resolution_time, time_range)
+    distribution = aggregate_distributions(channel_distributions)
+    distribution['channels'] = channel_distributions
+    return distribution
 
-        # Liquidity
-        bucket_times, chan_time = liquidity_states[chan_id].calculate_time_in_buckets(
-            final_time, LIQUIDITY_BUCKETS, liquidity_bucket_fn)
-        for bucket, time_val in bucket_times.items():
-            liq_bucket_times[bucket] += time_val
 
-        total_time += chan_time
+def generate_report(distribution, output_file):
+    """Generate and write the utilization distribution report."""
+    slot_bucket_times = distribution['slot_bucket_times']
+    liq_bucket_times = distribution['liq_bucket_times']
+    total_time = distribution['total_time']
 
-    # Generate report
     lines = []
     lines.append("Incoming Channel Utilization Distribution")
     lines.append("==========================================")
     lines.append("")
-    lines.append(f"Total incoming channels analyzed: {len(all_channels)}")
+    lines.append(f"Total incoming channels analyzed: {distribution['channel_count']}")
     lines.append(f"Total observation time: {total_time:.0f} seconds ({total_time / 3600:.1f} hours)")
     lines.append("")
 
@@ -359,9 +407,237 @@ def main():
 
     # Write to file
     report = "\n".join(lines)
-    with open(args.output, 'w') as f:
+    with open(output_file, 'w') as f:
+        f.write(report)
+
+    return report
+
+
+def estimate_channel_sample(channel_distributions, fraction: float):
+    """Estimate full-dataset bucket times and percentages from a sample of incoming channels.
+
+    Each sampled channel's distribution is exact when it is simulated over
+    the full dataset's time range, so estimates are scaled up by the
+    sampling fraction with standard errors across channels.
+    """
+    channels = list(channel_distributions.values())
+    channel_times = [dist['total_time'] for dist in channels]
+
+    estimate = {
+        'sample_by': "channel",
+        'fraction': fraction,
+        'sampled_units': len(channels),
+        'channel_count': ht_total([1] * len(channels), fraction),
+        'total_time': ht_total(channel_times, fraction),
+    }
+
+    for key, buckets in (('slot_buckets', SLOT_BUCKETS), ('liq_buckets', LIQUIDITY_BUCKETS)):
+        times_key = 'slot_bucket_times' if key == 'slot_buckets' else 'liq_bucket_times'
+        estimate[key] = {}
+        for bucket in buckets + [">max"]:
+            bucket_times = [dist[times_key][bucket] for dist in channels]
+            estimate[key][bucket] = {
+                'time': ht_total(bucket_times, fraction),
+                'percent': ht_ratio(bucket_times, channel_times, fraction),
+            }
+
+    return estimate
+
+
+def estimate_block_sample(block_distributions, fraction: float, span: float, channel_count: int):
+    """Estimate full-dataset bucket times and percentages from a sample of time blocks.
+
+    Time in non-zero buckets is scaled up from the sampled blocks. Channels
+    spend the rest of the observation period (span seconds, for each of the
+    channel_count incoming channels in the full data) in the zero bucket.
+    """
+    total_time = channel_count * span
+
+    estimate = {
+        'sample_by': "block",
+        'fraction': fraction,
+        'sampled_units': len(block_distributions),
+        'channel_count': (channel_count, 0.0),
+        'total_time': (total_time, 0.0),
+    }
+
+    for key, buckets in (('slot_buckets', SLOT_BUCKETS), ('liq_buckets', LIQUIDITY_BUCKETS)):
+        times_key = 'slot_bucket_times' if key == 'slot_buckets' else 'liq_bucket_times'
+        estimate[key] = {}
+        for bucket in buckets[1:] + [">max"]:
+            time_est, time_se = ht_total([dist[times_key][bucket] for dist in block_distributions], fraction)
+            estimate[key][bucket] = {
+                'time': (time_est, time_se),
+                'percent': (time_est / total_time, time_se / total_time) if total_time > 0 else (0.0, 0.0),
+            }
+
+        busy_est, busy_se = ht_total([
+            sum(time_val for bucket, time_val in dist[times_key].items() if bucket != buckets[0])
+            for dist in block_distributions
+        ], fraction)
+        zero_time = max(total_time - busy_est, 0.0)
+        estimate[key][buckets[0]] = {
+            'time': (zero_time, busy_se),
+            'percent': (zero_time / total_time, busy_se / total_time) if total_time > 0 else (0.0, 0.0),
+        }
+
+    return estimate
+
+
+def generate_sampled_report(estimate, output_file):
+    """Generate and write a utilization report from sampled estimates, with 95% confidence intervals."""
+    unit = "incoming channels" if estimate['sample_by'] == SAMPLE_BY_CHANNEL else "time blocks"
+    channel_count, channel_count_se = estimate['channel_count']
+    total_time, total_time_se = estimate['total_time']
+
+    lines = []
+    lines.append("Incoming Channel Utilization Distribution (Sampled Estimate)")
+    lines.append("=============================================================")
+    lines.append("")
+    lines.append(f"Sampled {estimate['fraction'] * 100:.1f}% of {unit} ({estimate['sampled_units']} sampled)")
+    lines.append("Estimates are scaled to the full dataset, with 95% confidence intervals")
+    if estimate['sampled_units'] < MIN_SAMPLED_UNITS:
+        lines.append(f"Warning: fewer than {MIN_SAMPLED_UNITS} {unit} sampled, confidence intervals are unreliable")
+    lines.append("")
+    lines.append(f"Estimated incoming channels: {channel_count:.0f} (± {Z_95 * channel_count_se:.0f})")
+    lines.append(f"Estimated observation time: {total_time:.0f} seconds (± {Z_95 * total_time_se:.0f})")
+    lines.append("")
+
+    for title, key, buckets, format_bucket in (
+            ("Slot Utilization:", 'slot_buckets', SLOT_BUCKETS, format_slot_bucket),
+            ("Liquidity Utilization:", 'liq_buckets', LIQUIDITY_BUCKETS, format_liquidity_bucket)):
+        lines.append(title)
+        lines.append("-" * len(title))
+        lines.append(f"{'Bucket':<15} {'Time (seconds)':>15} {'Percent':>10} {'95% CI':>10}")
+
+        for bucket in buckets + [">max"]:
+            time_est, _ = estimate[key][bucket]['time']
+            pct, pct_se = estimate[key][bucket]['percent']
+            lines.append(f"{format_bucket(bucket):<15} {time_est:>15.0f} {pct * 100:>9.2f}% {Z_95 * pct_se * 100:>8.2f}%")
+
+        lines.append("")
+
+    # Write to file
+    report = "\n".join(lines).rstrip("\n")
+    with open(output_file, 'w') as f:
         f.write(report)
 
+    return report
+
+
+def resolution_time_label(resolution_time: float):
+    """Format a resolution time for use in output file names."""
+    return f"{int(resolution_time)}s" if resolution_time >= 1 else f"{resolution_time:.1f}s"
+
+
+def estimate_sample(input_csv_file: str, channel_info, fraction: float, sample_by: str = SAMPLE_BY_CHANNEL,
+                    resolution_time: float = HTLC_RESOLUTION_TIME, block_secs: float = BLOCK_SECS,
+                    seed: int = 0, start_ts: float = None, end_ts: float = None):
+    """Estimate the utilization distribution from a deterministic sample of the forwards in a CSV."""
+    sampler = Sampler(fraction, seed)
+
+    if sample_by == SAMPLE_BY_CHANNEL:
+        forwards = load_channel_sample(input_csv_file, sampler, ['chan_id_in'], start_ts, end_ts)
+        # Observe sampled channels over the same period as the full dataset
+        time_range = data_time_range(input_csv_file, start_ts, end_ts)
+        distribution = simulate_utilization(forwards, channel_info, resolution_time, time_range)
+        estimate = estimate_channel_sample(distribution['channels'], fraction)
+        estimate['forward_count'] = len(forwards)
+    else:
+        blocks = sampled_blocks(input_csv_file, sampler, block_secs, start_ts, end_ts)
+        block_forwards = load_block_sample(input_csv_file, blocks)
+        block_distributions = [
+            simulate_utilization(forwards, channel_info, resolution_time)
+            for forwards in block_forwards
+        ]
+        channels = set()
+        for dist in block_distributions:
+            channels.update(dist['channels'])
+        # Channels without forwards in any sampled block still count towards time in the zero bucket
+        incoming_count = channel_count(input_csv_file, ['chan_id_in'], start_ts, end_ts, channels)
+
+        time_range = data_time_range(input_csv_file, start_ts, end_ts)
+        span = (time_range[1] - time_range[0] + resolution_time * 2) if time_range else 0.0
+        estimate = estimate_block_sample(block_distributions, fraction, span, incoming_count)
+        estimate['forward_count'] = sum(len(forwards) for forwards in block_forwards)
+
+    return estimate
+
+
+def run_sampled(args, channel_info):
+    """Estimate the utilization distribution from a deterministic sample of the forwards, and write a report."""
+    unit = "incoming channels" if args.sample_by == SAMPLE_BY_CHANNEL else "time blocks"
+    print(f"Estimating utilization from {args.sample * 100:.1f}% of {unit} in {args.input_csv_file}...")
+    estimate = estimate_sample(args.input_csv_file, channel_info, args.sample, args.sample_by,
+                               args.htlc_resolution_time, args.sample_block_secs, args.sample_seed,
+                               args.start, args.end)
+    print(f"Processed {estimate['forward_count']} forwards from {estimate['sampled_units']} sampled {unit}")
+
+    if estimate['sampled_units'] == 0:
+        hint = "--sample, or decrease --sample-block-secs" if args.sample_by == SAMPLE_BY_BLOCK else "--sample"
+        print(f"Error: No {unit} were sampled, increase {hint}")
+        sys.exit(1)
+    if estimate['sampled_units'] < MIN_SAMPLED_UNITS:
+        print(f"Warning: only {estimate['sampled_units']} {unit} sampled, confidence intervals are unreliable")
+
+    generate_sampled_report(estimate, args.output)
+
+    print(f"Results written to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calculate channel utilization distributions")
+    parser.add_argument("input_csv_file", help="Forwarding events CSV file")
+    parser.add_argument("channel_info_file", help="Channel capacity info CSV file")
+    parser.add_argument("--output", default=None, help="Output file (default: auto-generated based on resolution time)")
+    parser.add_argument("--htlc-resolution-time", type=float, default=HTLC_RESOLUTION_TIME,
+                        help=f"HTLC resolution time in seconds (default: {HTLC_RESOLUTION_TIME})")
+    parser.add_argument("--start", type=int, default=None, help="Only include forwards at or after this unix timestamp in seconds (default: all)")
+    parser.add_argument("--end", type=int, default=None, help="Only include forwards before this unix timestamp in seconds (default: all)")
+    parser.add_argument("--sample", type=float, default=None, help="Estimate results from this fraction of the data, eg 0.1 (default: exact)")
+    parser.add_argument("--sample-by", choices=SAMPLE_BY, default=SAMPLE_BY_CHANNEL, help=f"Sample incoming channels or time blocks (default: {SAMPLE_BY_CHANNEL})")
+    parser.add_argument("--sample-block-secs", type=int, default=BLOCK_SECS, help=f"Time block size in seconds when sampling by block (default: {BLOCK_SECS}, which is 1 day)")
+    parser.add_argument("--sample-seed", type=int, default=0, help="Seed used to select sampled channels or blocks (default: 0)")
+    args = parser.parse_args()
+
+    if args.sample is not None and not 0 < args.sample <= 1:
+        parser.error(f"--sample must be greater than 0 and at most 1, got {args.sample}")
+    if args.sample_block_secs <= 0:
+        parser.error(f"--sample-block-secs must be positive, got {args.sample_block_secs}")
+
+    # Generate output filename if not specified
+    if args.output is None:
+        sample_label = "_sample" if args.sample is not None else ""
+        args.output = f"channel_utilization_distribution_{resolution_time_label(args.htlc_resolution_time)}{sample_label}.txt"
+
+    # Load channel info
+    print(f"Loading channel info from {args.channel_info_file}...")
+    channel_info = read_channel_info_from_csv(args.channel_info_file)
+    print(f"Loaded info for {len(channel_info)} channels")
+
+    if args.sample is not None:
+        run_sampled(args, channel_info)
+        return
+
+    # Load forwards
+    print(f"Loading forwards from {args.input_csv_file}...")
+    forwards = read_forwards_from_csv(args.input_csv_file, args.start, args.end)
+    print(f"Loaded {len(forwards)} forwards")
+
+    exact_count = sum(1 for fwd in forwards if fwd.get('hold_time') is not None)
+    if exact_count > 0:
+        print(f"Using exact hold times for {exact_count} forwards, "
+              f"{args.htlc_resolution_time}s for the remaining {len(forwards) - exact_count}")
+
+    if len(forwards) == 0:
+        print("No forwards found.")
+        return
+
+    print("Processing forwards...")
+    distribution = simulate_utilization(forwards, channel_info, args.htlc_resolution_time)
+
+    generate_report(distribution, args.output)
+
     print(f"Results written to {args.output}")
 
 